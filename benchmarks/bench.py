@@ -0,0 +1,214 @@
+"""
+Anime Downloader benchmarks
+Runs searches and downloads against the local mock provider and CDN and
+reports throughput, time to first byte, per-episode wall time and peak memory.
+
+    python benchmarks/bench.py batch-hls --episodes 6 --bandwidth 2048
+    python benchmarks/bench.py all --json
+
+run_scenario() returns the same numbers as a dict for use in regression tests.
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from anipy_api.provider import LanguageTypeEnum
+
+import core
+import hls
+import network
+from journal import DOWNLOADING
+from mock import MockCDN, MockProvider
+from scheduler import DownloadScheduler, DEFAULT_WORKERS
+
+
+SCENARIOS = {
+    # name: (stream kind, episodes)
+    "single-progressive": ("mp4", 1),
+    "single-hls": ("hls", 1),
+    "batch-progressive": ("mp4", 6),
+    "batch-hls": ("hls", 6),
+}
+
+
+class EpisodeTimer:
+    """Per-episode timestamps collected from scheduler callbacks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = {}
+        # Start of the download attempt still waiting for its first byte
+        self.downloading = {}
+        # Time to first byte of every attempt, retries included
+        self.first_bytes = []
+        self.finished = {}
+
+    def state(self, episode, state):
+        now = time.perf_counter()
+        with self._lock:
+            self.started.setdefault(episode, now)
+            if state == DOWNLOADING:
+                self.downloading[episode] = now
+
+    def progress(self, episode, percentage, overall):
+        now = time.perf_counter()
+        with self._lock:
+            if percentage > 0 and episode in self.downloading:
+                self.first_bytes.append(now - self.downloading.pop(episode))
+
+    def done(self, episode, path):
+        with self._lock:
+            self.finished[episode] = time.perf_counter()
+
+    def ttfb(self):
+        return list(self.first_bytes)
+
+    def wall_times(self):
+        return [self.finished[ep] - self.started[ep] for ep in self.finished if ep in self.started]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {"mean": statistics.fmean(values), "min": min(values), "max": max(values)}
+
+
+def run_search(provider_latency=0.0, queries=20):
+    """Time core.search against the mock provider, without and with the metadata cache
+
+    Provider failures are not injected here, a failed search has no timing to
+    compare; --provider-failure-rate only applies to the download scenarios.
+    """
+    from cache import MetadataCache
+
+    provider = MockProvider(None, latency=provider_latency)
+    tmp = Path(tempfile.mkdtemp(prefix="bench-cache-"))
+    cache = MetadataCache(tmp / "metadata.sqlite3")
+    try:
+        timings = {}
+        for label, used_cache in (("uncached", None), ("cached", cache)):
+            started = time.perf_counter()
+            for _ in range(queries):
+                core.search(provider, "frieren", used_cache)
+            timings[label] = (time.perf_counter() - started) / queries
+        return {"scenario": "search", "queries": queries, "seconds_per_query": timings}
+    finally:
+        cache.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def run_scenario(name="batch-hls", episodes=None, size=4 * 1024 * 1024, segments=32, latency=0.0,
+                 bandwidth=0, failure_rate=0.0, provider_latency=0.0, provider_failure_rate=0.0,
+                 workers=DEFAULT_WORKERS, segment_workers=hls.DEFAULT_SEGMENT_WORKERS, seed=1, container=None):
+    """Download synthetic episodes through the scheduler and return the measurements
+
+    Bandwidth is in bytes per second per connection. container=None keeps the
+    downloaded .ts/.mp4, so no ffmpeg is needed.
+    """
+    kind, default_episodes = SCENARIOS[name]
+    episodes = episodes or default_episodes
+    hls.configure(segment_workers)
+    download_dir = Path(tempfile.mkdtemp(prefix="bench-"))
+    timer = EpisodeTimer()
+    errors = {}
+
+    with MockCDN(size=size, segments=segments, latency=latency, bandwidth=bandwidth,
+                 failure_rate=failure_rate, seed=seed) as cdn:
+        provider = MockProvider(cdn, episodes=episodes, kind=kind, latency=provider_latency,
+                                failure_rate=provider_failure_rate, seed=seed)
+        # Failures are injected into the episode and stream lookups, not this setup step
+        anime = core.anime_from_result(provider, provider.search_result("bench"))
+        scheduler = DownloadScheduler(
+            anime, LanguageTypeEnum.SUB, 720, download_dir,
+            max_workers=workers,
+            on_progress=timer.progress,
+            on_episode_done=timer.done,
+            on_episode_failed=lambda episode, error: errors.__setitem__(episode, repr(error)),
+            on_state=timer.state,
+            container=container
+        )
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            completed, failed = scheduler.run(range(1, episodes + 1))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            shutil.rmtree(download_dir, ignore_errors=True)
+        requests, bytes_sent = cdn.requests, cdn.bytes_sent
+
+    downloaded = len(completed) * size
+    return {
+        "scenario": name,
+        "episodes": episodes,
+        "completed": len(completed),
+        "failed": len(failed),
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput_mib_s": downloaded / elapsed / 2 ** 20 if elapsed else 0.0,
+        "ttfb": summarize(timer.ttfb()),
+        "episode_wall_time": summarize(timer.wall_times()),
+        "peak_memory_mib": peak / 2 ** 20,
+        "cdn_requests": requests,
+        "cdn_bytes": bytes_sent,
+    }
+
+
+def format_result(result):
+    if result["scenario"] == "search":
+        timings = result["seconds_per_query"]
+        return f"search: {timings['uncached'] * 1000:.2f} ms uncached, {timings['cached'] * 1000:.2f} ms cached per query"
+    ttfb = result["ttfb"]["mean"] * 1000 if result["ttfb"] else float("nan")
+    wall = result["episode_wall_time"]["mean"] if result["episode_wall_time"] else float("nan")
+    return (f"{result['scenario']}: {result['completed']}/{result['episodes']} episodes in {result['elapsed']:.2f}s, "
+            f"{result['throughput_mib_s']:.1f} MiB/s, ttfb {ttfb:.1f} ms, episode {wall:.2f}s, "
+            f"peak {result['peak_memory_mib']:.1f} MiB, {result['cdn_requests']} requests")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark downloads against a local mock provider and CDN.")
+    parser.add_argument("scenario", nargs="?", default="all", choices=["all", "search", *SCENARIOS])
+    parser.add_argument("--episodes", type=int, default=None, help="episodes per batch (default: per scenario)")
+    parser.add_argument("--size", type=float, default=4, metavar="MIB", help="episode size (default: %(default)s)")
+    parser.add_argument("--segments", type=int, default=32, help="HLS segments per episode (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS", help="CDN latency per request (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=int, default=0, metavar="KBPS", help="CDN bandwidth per connection, 0 for unlimited (default: %(default)s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of CDN requests answered with 503 (default: %(default)s)")
+    parser.add_argument("--provider-latency", type=float, default=0.0, metavar="MS", help="latency of each provider call (default: %(default)s)")
+    parser.add_argument("--provider-failure-rate", type=float, default=0.0, help="fraction of episode and stream lookups that fail, not applied to search (default: %(default)s)")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help="parallel episode downloads (default: %(default)s)")
+    parser.add_argument("--segment-workers", type=int, default=hls.DEFAULT_SEGMENT_WORKERS, help="parallel HLS segment fetches, 0 for anipy-api's downloader (default: %(default)s)")
+    parser.add_argument("--limit-rate", type=int, default=0, metavar="KBPS", help="client bandwidth cap (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for failure injection (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON lines")
+    args = parser.parse_args(argv)
+
+    network.configure(max_rate=args.limit_rate * 1024)
+    names = ["search", *SCENARIOS] if args.scenario == "all" else [args.scenario]
+    for name in names:
+        if name == "search":
+            result = run_search(provider_latency=args.provider_latency / 1000)
+        else:
+            result = run_scenario(
+                name, episodes=args.episodes, size=int(args.size * 2 ** 20), segments=args.segments,
+                latency=args.latency / 1000, bandwidth=args.bandwidth * 1024, failure_rate=args.failure_rate,
+                provider_latency=args.provider_latency / 1000, provider_failure_rate=args.provider_failure_rate,
+                workers=args.jobs, segment_workers=args.segment_workers, seed=args.seed
+            )
+        print(json.dumps(result) if args.json else format_result(result), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""
+Mock provider and CDN
+A local stand-in for an anipy-api provider plus an HTTP server that serves
+synthetic progressive (mp4) and HLS streams, with configurable latency,
+bandwidth and failure injection
+"""
+
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from anipy_api.provider import LanguageTypeEnum, ProviderInfoResult, ProviderSearchResult, ProviderStream
+
+
+CHUNK_SIZE = 16 * 1024
+PATTERN = bytes(range(256)) * (CHUNK_SIZE // 256)
+
+
+def payload(size):
+    """Deterministic bytes of the given size"""
+    repeats, rest = divmod(size, len(PATTERN))
+    return PATTERN * repeats + PATTERN[:rest]
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """Server that does not print a traceback when a client hangs up early"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FailureInjector:
+    """Fails a fraction of calls, reproducibly when seeded"""
+
+    def __init__(self, rate=0.0, seed=None):
+        self.rate = rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.rate
+
+
+class MockCDN:
+    """Threaded HTTP server for synthetic streams
+
+    Routes:
+        /progressive/<episode>.mp4      `size` bytes
+        /hls/<episode>/index.m3u8       playlist of `segments` segments
+        /hls/<episode>/seg<i>.ts        size // segments bytes each
+    """
+
+    def __init__(self, size=8 * 1024 * 1024, segments=64, latency=0.0, bandwidth=0, failure_rate=0.0, seed=None):
+        self.size = size
+        self.segments = segments
+        self.latency = latency
+        # Bytes per second per connection, 0 for unlimited
+        self.bandwidth = bandwidth
+        self.failures = FailureInjector(failure_rate, seed)
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _playlist(self):
+        duration = 4
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{duration}", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for index in range(self.segments):
+            lines += [f"#EXTINF:{duration}.0,", f"seg{index}.ts"]
+        lines.append("#EXT-X-ENDLIST")
+        return ("\n".join(lines) + "\n").encode()
+
+    def _body(self, path):
+        """Return (content type, body) for a path, or None for 404"""
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "progressive" and parts[1].endswith(".mp4"):
+            return "video/mp4", payload(self.size)
+        if len(parts) == 3 and parts[0] == "hls":
+            if parts[2] == "index.m3u8":
+                return "application/vnd.apple.mpegurl", self._playlist()
+            if parts[2].startswith("seg") and parts[2].endswith(".ts"):
+                return "video/mp2t", payload(self.size // self.segments)
+        return None
+
+    def _handler(self):
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with cdn._lock:
+                    cdn.requests += 1
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+                if cdn.failures.should_fail():
+                    self.send_error(503, "Injected failure")
+                    return
+                found = cdn._body(self.path)
+                if found is None:
+                    self.send_error(404)
+                    return
+                content_type, body = found
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                for offset in range(0, len(body), CHUNK_SIZE):
+                    chunk = body[offset:offset + CHUNK_SIZE]
+                    started = time.monotonic()
+                    self.wfile.write(chunk)
+                    with cdn._lock:
+                        cdn.bytes_sent += len(chunk)
+                    if cdn.bandwidth:
+                        remaining = len(chunk) / cdn.bandwidth - (time.monotonic() - started)
+                        if remaining > 0:
+                            time.sleep(remaining)
+
+        return Handler
+
+    def start(self):
+        self._server = QuietHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class MockProvider:
+    """Stand-in for an anipy-api provider whose streams point at a MockCDN"""
+
+    NAME = "mock"
+    BASE_URL = "http://127.0.0.1"
+
+    def __init__(self, cdn, episodes=12, kind="hls", latency=0.0, failure_rate=0.0, seed=None):
+        self.cdn = cdn
+        self.episodes = episodes
+        self.kind = kind
+        # Seconds per provider call, like the round trips of a real provider
+        self.latency = latency
+        self.failures = FailureInjector(failure_rate, seed)
+
+    def _call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failures.should_fail():
+            raise ConnectionError("Injected provider failure")
+
+    def search_result(self, query):
+        """The result get_search returns, without latency or failure injection"""
+        return ProviderSearchResult("mock-1", f"Mock {query}", {LanguageTypeEnum.SUB, LanguageTypeEnum.DUB})
+
+    def get_search(self, query):
+        self._call()
+        return [self.search_result(query)]
+
+    def get_episodes(self, identifier, lang):
+        self._call()
+        return list(range(1, self.episodes + 1))
+
+    def get_info(self, identifier):
+        self._call()
+        return ProviderInfoResult(name=identifier)
+
+    def get_video(self, identifier, episode, lang):
+        self._call()
+        if self.kind == "hls":
+            url = f"{self.cdn.base_url}/hls/{episode}/index.m3u8"
+        else:
+            url = f"{self.cdn.base_url}/progressive/{episode}.mp4"
+        return [ProviderStream(url, 720, episode, lang, container="hls" if self.kind == "hls" else "mp4")]
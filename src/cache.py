@@ -0,0 +1,125 @@
+"""
+Metadata cache
+Persistent SQLite cache for provider search results, episode lists and
+resolved streams
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from paths import user_cache_dir
+
+
+DEFAULT_MAX_ENTRIES = 2000
+# Seconds an entry stays fresh, per kind of lookup
+DEFAULT_TTLS = {
+    "search": 6 * 60 * 60,
+    "episodes": 60 * 60,
+    # Streams carry their own expiry, see streams.StreamCache
+    "streams": 6 * 60 * 60,
+}
+
+
+class MetadataCache:
+    """Cache keyed by (kind, provider, key, language) with a TTL and LRU eviction"""
+
+    def __init__(self, path=None, ttls=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = Path(path) if path else user_cache_dir() / "metadata.sqlite3"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT, provider TEXT, key TEXT, lang TEXT,"
+                " value BLOB, stored REAL, accessed REAL,"
+                " PRIMARY KEY (kind, provider, key, lang))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    @staticmethod
+    def _key(kind, provider, key, lang):
+        provider = getattr(provider, 'NAME', provider)
+        lang = getattr(lang, 'value', lang)
+        return kind, str(provider), str(key), str(lang or "")
+
+    def get(self, kind, provider, key, lang=None):
+        """Get a fresh cached value, or None on a miss"""
+        params = self._key(kind, provider, key, lang)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, stored FROM entries WHERE kind=? AND provider=? AND key=? AND lang=?", params
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if now - row[1] > self.ttls.get(kind, 0):
+                with self._db:
+                    self._db.execute("DELETE FROM entries WHERE kind=? AND provider=? AND key=? AND lang=?", params)
+                return None
+            with self._db:
+                self._db.execute(
+                    "UPDATE entries SET accessed=? WHERE kind=? AND provider=? AND key=? AND lang=?", (now, *params)
+                )
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None
+
+    def put(self, kind, provider, key, value, lang=None):
+        """Store a value and evict the least recently used entries over the limit"""
+        params = self._key(kind, provider, key, lang)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*params, pickle.dumps(value), now, now)
+            )
+            self._db.execute(
+                "DELETE FROM entries WHERE rowid IN ("
+                " SELECT rowid FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, kind, provider, key, lang=None):
+        """Drop a single entry"""
+        params = self._key(kind, provider, key, lang)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE kind=? AND provider=? AND key=? AND lang=?", params)
+
+    def fetch(self, kind, provider, key, loader, lang=None, refresh=False):
+        """Return the cached value or call loader() and cache its result
+
+        With refresh=True the cache is bypassed and overwritten.
+        """
+        if not refresh:
+            value = self.get(kind, provider, key, lang)
+            if value is not None:
+                return value
+        value = loader()
+        self.put(kind, provider, key, value, lang)
+        return value
+
+    def search(self, provider, query, refresh=False):
+        """Cached provider.get_search(query)"""
+        key = " ".join(query.lower().split())
+        return self.fetch("search", provider, key, lambda: provider.get_search(query), refresh=refresh)
+
+    def episodes(self, anime, lang, refresh=False):
+        """Cached anime.get_episodes(lang)"""
+        return self.fetch("episodes", anime.provider, anime.identifier, lambda: anime.get_episodes(lang=lang),
+                          lang=lang, refresh=refresh)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,286 @@
+"""
+Anime Downloader command line
+Headless search and batch download on top of the same core and scheduler
+as the GUI
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+import core
+import hls
+import network
+import startup
+import telemetry
+from cache import MetadataCache
+from journal import JobJournal
+from scheduler import DownloadScheduler, DEFAULT_WORKERS, MAX_WORKERS
+from streams import StreamCache
+from verify import PostProcessor, DEFAULT_POST_WORKERS, TRANSCODE_PRESETS
+from providers import ProviderPool, DEFAULT_PROVIDERS
+from watchlist import Watchlist, WatchlistSync, DEFAULT_INTERVAL
+
+
+def build_parser(version):
+    parser = argparse.ArgumentParser(prog="main.py", description="Search and download anime without the GUI.")
+    parser.add_argument("-V", "--version", action="version", version=f"%(prog)s {version}")
+    parser.add_argument("--span-log", type=Path, default=telemetry.default_span_log(), metavar="PATH",
+                        help="JSON-lines log of timing spans and events (default: %(default)s)")
+    parser.add_argument("--no-span-log", dest="span_log", action="store_const", const=None, help="do not write the span log")
+    parser.add_argument("--metrics-file", type=Path, metavar="PATH", help="keep Prometheus-style metrics in this text file")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus-style metrics on localhost:PORT/metrics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(command):
+        command.add_argument("query", help="anime name to search for")
+        command.add_argument("--providers", default=",".join(DEFAULT_PROVIDERS), type=lambda text: [name.strip() for name in text.split(",") if name.strip()],
+                             help="comma-separated anipy-api providers, searched together and tried in order (default: %(default)s)")
+        command.add_argument("--refresh", action="store_true", help="bypass the search and episode cache")
+
+    search_cmd = commands.add_parser("search", help="list search results")
+    add_common(search_cmd)
+
+    download_cmd = commands.add_parser("download", help="download episodes of the first (or --pick'ed) result")
+    add_common(download_cmd)
+    add_selection(download_cmd)
+    download_cmd.add_argument("--episodes", default="all", metavar="SPEC", help='episodes to download, e.g. "1-12", "3,5", "120-" (default: all)')
+    download_cmd.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help=f"parallel downloads, 1-{MAX_WORKERS} (default: %(default)s)")
+    download_cmd.add_argument("--limit-rate", type=int, default=0, metavar="KBPS", help="total bandwidth cap in KB/s, 0 for unlimited (default: %(default)s)")
+    download_cmd.add_argument("--per-host", type=int, default=network.DEFAULT_PER_HOST, metavar="N", help="max connections to one host (default: %(default)s)")
+    download_cmd.add_argument("--segment-workers", type=int, default=hls.DEFAULT_SEGMENT_WORKERS, metavar="N", help="parallel HLS segment fetches per episode, 0 uses anipy-api's downloader (default: %(default)s)")
+    download_cmd.add_argument("-o", "--output", type=Path, default=Path.home() / "Downloads", help="download directory (default: %(default)s)")
+    download_cmd.add_argument("--root", type=Path, action="append", default=[], metavar="DIR", dest="roots",
+                              help="another download directory; each episode goes to the one with the most free space (repeatable)")
+    download_cmd.add_argument("--no-space-check", dest="check_space", action="store_false",
+                              help="start even if the estimated batch size exceeds the free space")
+    add_post_processing(download_cmd)
+
+    watch_cmd = commands.add_parser("watch", help="manage the watchlist used by sync")
+    watch_commands = watch_cmd.add_subparsers(dest="watch_command", required=True)
+    watch_add = watch_commands.add_parser("add", help="follow the first (or --pick'ed) search result")
+    add_common(watch_add)
+    add_selection(watch_add)
+    watch_add.add_argument("-o", "--output", type=Path, default=Path.home() / "Downloads", help="download directory (default: %(default)s)")
+    watch_commands.add_parser("list", help="show followed anime")
+    watch_remove = watch_commands.add_parser("remove", help="stop following an anime")
+    watch_remove.add_argument("number", type=int, help="entry number from 'watch list'")
+
+    sync_cmd = commands.add_parser("sync", help="download new episodes of watched anime")
+    sync_cmd.add_argument("--once", action="store_true", help="check every entry once and exit")
+    sync_cmd.add_argument("--interval", type=float, default=DEFAULT_INTERVAL / 60, metavar="MINUTES", help="time between checks of one show (default: %(default)s)")
+    sync_cmd.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKERS, help=f"parallel downloads, 1-{MAX_WORKERS} (default: %(default)s)")
+    add_post_processing(sync_cmd)
+    return parser
+
+
+def add_selection(command):
+    command.add_argument("--pick", type=int, default=1, metavar="N", help="use the N-th search result (default: 1)")
+    command.add_argument("--lang", default="SUB", type=str.upper, choices=["SUB", "DUB"])
+    command.add_argument("--quality", default="720", choices=core.QUALITIES)
+
+
+def add_post_processing(command):
+    command.add_argument("--no-verify", dest="verify", action="store_false",
+                         help="skip checking finished downloads (remuxing then happens in the download workers)")
+    command.add_argument("--post-workers", type=int, default=DEFAULT_POST_WORKERS, metavar="N",
+                         help="processes for verification, remuxing and transcoding (default: %(default)s)")
+    command.add_argument("--transcode", choices=sorted(TRANSCODE_PRESETS), help="re-encode finished episodes with ffmpeg")
+
+
+def post_processor(args):
+    """The post-processing pool selected by the command line, or None"""
+    if not args.verify:
+        if args.transcode:
+            raise ValueError("--transcode needs verification, drop --no-verify")
+        return None
+    return PostProcessor(args.post_workers, args.transcode)
+
+
+def open_cache():
+    """Open the metadata cache, running without it if that fails"""
+    try:
+        return MetadataCache()
+    except Exception as e:
+        print(f"warning: metadata cache unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def search_providers(args, cache):
+    """Search every selected provider, reporting providers that fail"""
+    def on_results(results, provider_name, error):
+        if error is not None:
+            print(f"warning: {provider_name} search failed: {error}", file=sys.stderr)
+    pool = ProviderPool(args.providers)
+    return pool, pool.search(args.query, cache, refresh=args.refresh, on_results=on_results)
+
+
+def cmd_search(args, cache):
+    _, results = search_providers(args, cache)
+    if not results:
+        print("No results")
+        return 1
+    for number, result in enumerate(results, 1):
+        languages = ", ".join(sorted(lang.name for lang in result.languages))
+        print(f"{number:3}. {result.name} ({languages}) [{', '.join(result.provider_names)}]")
+    return 0
+
+
+def pick_anime(args, cache):
+    """Search and return the (anime, lang) selected by --pick and --lang"""
+    pool, results = search_providers(args, cache)
+    if not 1 <= args.pick <= len(results):
+        raise LookupError(f"no search result #{args.pick} for {args.query!r} ({len(results)} found)")
+    anime = pool.anime_from_result(results[args.pick - 1])
+    lang = core.parse_language(args.lang)
+    if lang not in anime.languages:
+        raise LookupError(f"{anime.name} is not available in {lang.name}")
+    return anime, lang
+
+
+def cmd_download(args, cache):
+    anime, lang = pick_anime(args, cache)
+    episodes = core.parse_episode_range(args.episodes, core.get_episodes(anime, lang, cache, refresh=args.refresh))
+    if not episodes:
+        print(f"error: no episodes match {args.episodes!r}", file=sys.stderr)
+        return 1
+    network.configure(max_rate=args.limit_rate * 1024, per_host=args.per_host)
+    hls.configure(args.segment_workers)
+    print(f"Downloading {len(episodes)} episodes of {anime.name} ({lang.name}, {args.quality}p) to {args.output}")
+
+    try:
+        journal = JobJournal()
+        job_id = journal.create_job(anime, lang, args.quality, args.output, anime.name, episodes)
+    except Exception as e:
+        print(f"warning: download journal unavailable: {e}", file=sys.stderr)
+        journal = job_id = None
+
+    reported = {"overall": -1}
+    lock = threading.Lock()
+
+    def progress_callback(episode, percentage, overall):
+        with lock:
+            if int(overall) // 5 > reported["overall"] // 5:
+                reported["overall"] = int(overall)
+                print(f"  {overall:5.1f}% overall")
+    def episode_done(episode, path):
+        print(f"Episode {episode}: done -> {path}")
+    def episode_failed(episode, error):
+        print(f"Episode {episode}: failed: {error}", file=sys.stderr)
+    def state_callback(episode, state):
+        if journal:
+            journal.record(job_id, episode, state)
+
+    post = post_processor(args)
+    scheduler = DownloadScheduler(
+        anime, lang, args.quality, args.output,
+        max_workers=args.jobs,
+        on_progress=progress_callback,
+        on_episode_done=episode_done,
+        on_episode_failed=episode_failed,
+        on_state=state_callback,
+        stream_cache=StreamCache(store=cache),
+        post_processor=post,
+        download_roots=args.roots,
+        check_space=args.check_space
+    )
+    outcome = {}
+
+    def run_batch():
+        try:
+            outcome["result"] = scheduler.run(episodes)
+        except Exception as e:
+            outcome["error"] = e
+    worker = threading.Thread(target=run_batch, daemon=True)
+    worker.start()
+    try:
+        # Join in short slices so Ctrl+C reaches the main thread
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("Cancelling, waiting for running downloads to stop...", file=sys.stderr)
+        scheduler.cancel()
+        worker.join()
+        return 130
+    finally:
+        if post:
+            post.shutdown(wait=False)
+    if journal:
+        journal.close_job(job_id)
+    if "error" in outcome:
+        # e.g. not enough free space, reported by run_cli
+        raise outcome["error"]
+    completed, failed = outcome.get("result", ([], episodes))
+    print(f"{len(completed)}/{len(episodes)} episodes downloaded")
+    return 1 if failed else 0
+
+
+def cmd_watch(args, cache):
+    watchlist = Watchlist()
+    if args.watch_command == "add":
+        anime, lang = pick_anime(args, cache)
+        watchlist.add(anime, lang, args.quality, args.output)
+        print(f"Watching {anime.name} ({lang.name}, {args.quality}p) -> {args.output}")
+    elif args.watch_command == "remove":
+        if not 1 <= args.number <= len(watchlist.entries):
+            raise LookupError(f"no watchlist entry #{args.number}")
+        print(f"Removed {watchlist.remove(args.number - 1)['name']}")
+    else:
+        if not watchlist.entries:
+            print("Watchlist is empty")
+        for number, entry in enumerate(watchlist.entries, 1):
+            print(f"{number:3}. {entry['name']} ({entry['lang'].upper()}, {entry['quality']}p) -> {entry['download_dir']}")
+    return 0
+
+
+def cmd_sync(args, cache):
+    watchlist = Watchlist()
+    if not watchlist.entries:
+        print("Watchlist is empty, add shows with 'watch add'")
+        return 1
+    post = post_processor(args)
+    sync = WatchlistSync(watchlist, cache, interval=args.interval * 60, max_workers=args.jobs,
+                         on_event=lambda message: print(time.strftime("[%H:%M:%S] ") + message),
+                         post_processor=post)
+    worker = threading.Thread(target=sync.run, kwargs={"once": args.once}, daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        print("Stopping after the current show...", file=sys.stderr)
+        sync.stop()
+        worker.join()
+        return 130
+    finally:
+        if post:
+            post.shutdown(wait=False)
+    return 0
+
+
+COMMANDS = {
+    "search": cmd_search,
+    "download": cmd_download,
+    "watch": cmd_watch,
+    "sync": cmd_sync,
+}
+
+
+def run_cli(argv, version):
+    """Run a command line invocation and return its exit code"""
+    args = build_parser(version).parse_args(argv)
+    try:
+        telemetry.configure(args.span_log, args.metrics_file, args.metrics_port)
+    except Exception as e:
+        print(f"warning: telemetry unavailable: {e}", file=sys.stderr)
+    with startup.phase("open cache"):
+        cache = open_cache()
+    # The command itself is not part of the startup profile
+    startup.report()
+    try:
+        return COMMANDS[args.command](args, cache)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
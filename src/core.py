@@ -0,0 +1,189 @@
+"""
+Anime Downloader core
+Search, episode listing, stream resolution and download helpers shared by
+the GUI and the command line
+"""
+
+from pathlib import Path
+
+from anipy_api.provider import get_provider, LanguageTypeEnum
+from anipy_api.anime import Anime
+
+import network
+import telemetry
+
+
+DEFAULT_PROVIDER = "allanime"
+QUALITIES = ("1080", "720", "480", "360")
+
+
+def init_provider(name=DEFAULT_PROVIDER):
+    """Get a provider instance by name"""
+    # get_provider returns an instance, do not call the result
+    provider = get_provider(name)
+    if provider is None:
+        raise ValueError(f"Unknown provider: {name}")
+    return provider
+
+
+def parse_language(text):
+    """Convert "SUB"/"DUB" into a LanguageTypeEnum"""
+    return LanguageTypeEnum.DUB if str(text).upper() == "DUB" else LanguageTypeEnum.SUB
+
+
+def default_language(languages):
+    """Pick SUB when available, otherwise any supported language"""
+    return LanguageTypeEnum.SUB if LanguageTypeEnum.SUB in languages else next(iter(languages))
+
+
+def search(provider, query, cache=None, refresh=False):
+    """Search a provider, through the metadata cache when given"""
+    with telemetry.span("search", provider=provider.NAME, query=query, cached=bool(cache)) as fields:
+        results = cache.search(provider, query, refresh=refresh) if cache else provider.get_search(query)
+        fields["results"] = len(results)
+        return results
+
+
+def anime_from_result(provider, result):
+    """Build an Anime from a search result, tolerating incomplete results"""
+    identifier = getattr(result, 'identifier', None)
+    if identifier is None:
+        identifier = getattr(result, 'id', None)
+    if identifier is None:
+        raise ValueError("Anime identifier not found in search result.")
+
+    name = getattr(result, 'name', None)
+    if name is None:
+        raise ValueError("Anime name not found in search result.")
+
+    languages = getattr(result, 'languages', None)
+    if not languages:
+        languages = [LanguageTypeEnum.SUB]
+    if not isinstance(languages, (set, list, tuple)):
+        languages = [languages]
+    return Anime(provider, name, identifier, set(languages))
+
+
+def describe_anime(anime):
+    """Serializable description of an anime, see anime_from_record"""
+    record = {
+        "provider": anime.provider.NAME,
+        "identifier": anime.identifier,
+        "name": anime.name,
+        "languages": sorted(language.value for language in anime.languages),
+    }
+    # A providers.FallbackAnime also records the providers it falls back to
+    fallbacks = getattr(anime, "animes", [])[1:]
+    if fallbacks:
+        record["fallbacks"] = [describe_anime(fallback) for fallback in fallbacks]
+    return record
+
+
+def anime_from_record(record, provider=None, init=init_provider):
+    """Rebuild an Anime from describe_anime() output
+
+    The given provider is reused when it matches the recorded one; other
+    providers are created with init(name). A record with fallbacks becomes a
+    providers.FallbackAnime again.
+    """
+    if provider is None or provider.NAME != record["provider"]:
+        provider = init(record["provider"])
+    languages = {LanguageTypeEnum(language) for language in record["languages"]}
+    animes = [Anime(provider, record["name"], record["identifier"], languages)]
+    for fallback in record.get("fallbacks", ()):
+        try:
+            animes.append(anime_from_record(fallback, init=init))
+        except ValueError:
+            # That provider is gone from anipy-api; go on without it
+            continue
+    if len(animes) == 1:
+        return animes[0]
+    from providers import FallbackAnime
+    return FallbackAnime(animes)
+
+
+def get_episodes(anime, lang, cache=None, refresh=False):
+    """List the episodes of an anime, through the metadata cache when given"""
+    with telemetry.span("episodes", provider=anime.provider.NAME, anime=anime.identifier, lang=lang.name) as fields:
+        episodes = cache.episodes(anime, lang, refresh=refresh) if cache else anime.get_episodes(lang=lang)
+        fields["episodes"] = len(episodes)
+        return episodes
+
+
+def resolve_stream(anime, episode, lang, quality):
+    """Resolve the stream of an episode, raising LookupError if there is none"""
+    with telemetry.span("resolve", anime=anime.identifier, episode=episode, lang=lang.name, quality=quality) as fields:
+        stream = anime.get_video(int(episode), lang, preferred_quality=int(quality))
+        if not stream:
+            raise LookupError(f"No stream found for Episode {episode} ({lang.name}, {quality}p)")
+        fields.update(container=stream.container, resolution=stream.resolution)
+        return stream
+
+
+def parse_episode_range(spec, episodes):
+    """Select episodes by a spec such as "1-12", "3,5,7-9" or "120-"
+
+    An empty spec or "all" selects every episode. Order follows `episodes`.
+    """
+    spec = (spec or "").strip().lower()
+    if spec in ("", "all", "*"):
+        return list(episodes)
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, _, end = part.partition("-")
+            start = float(start) if start.strip() else float("-inf")
+            end = float(end) if end.strip() else float("inf")
+        else:
+            start = end = float(part)
+        if start > end:
+            raise ValueError(f"Invalid episode range: {part}")
+        ranges.append((start, end))
+    return [episode for episode in episodes if any(start <= float(episode) <= end for start, end in ranges)]
+
+
+def safe_filename(name):
+    """Replace characters that are not allowed in file names"""
+    for char in '/\\:*?"<>|':
+        name = name.replace(char, '_')
+    return name
+
+
+def episode_filename(anime_name, episode_num):
+    """Build the file name used for a downloaded episode"""
+    return f"{safe_filename(anime_name)}_Episode_{episode_num}.mkv"
+
+
+def completed_download(path):
+    """Return True if path is a finished download
+
+    The downloader writes a .ts/.mp4 file first and only removes it after
+    remuxing into the final container, so a leftover intermediate means the
+    final file may be truncated.
+    """
+    path = Path(path)
+    if not path.is_file() or path.stat().st_size == 0:
+        return False
+    return not any(path.with_suffix(suffix).exists() for suffix in (".ts", ".mp4"))
+
+
+def download_stream(stream, download_path, progress_callback=None, info_callback=None, error_callback=None,
+                    container=".mkv"):
+    """Download a resolved stream over the shared session
+
+    The result is remuxed into `container`; None keeps the downloaded
+    .ts/.mp4 as is, which does not need ffmpeg.
+    """
+    downloader = network.PooledDownloader(network.get_session(), progress_callback, info_callback, error_callback)
+    with telemetry.span("download", episode=stream.episode, container=stream.container) as fields:
+        path = downloader.download(
+            stream=stream,
+            download_path=Path(download_path),
+            container=container,
+            max_retry=3
+        )
+        fields["path"] = str(path)
+        return path
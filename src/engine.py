@@ -0,0 +1,181 @@
+"""
+Background engine
+One asyncio event loop on a background thread owns the network work of the
+GUI. Blocking provider and download calls run on a fixed thread pool behind
+a semaphore per kind of job, jobs can be cancelled, and shutdown waits for
+running downloads to stop and clean up their partial files.
+"""
+
+import asyncio
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Jobs of one kind that may run at the same time; more wait for a slot
+DEFAULT_LIMITS = {
+    "search": 1,
+    "details": 2,
+    "download": 2,
+    "batch": 1,
+    "startup": 1,
+}
+SHUTDOWN_TIMEOUT = 15
+
+
+class Job:
+    """Handle for a submitted job"""
+
+    def __init__(self, kind, on_cancel=None):
+        self.kind = kind
+        self.future = None
+        self.started = False
+        self._on_cancel = on_cancel
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    def cancel(self):
+        """Drop the job if it has not started, otherwise ask it to stop
+
+        A started job finishes through its on_done/on_error callbacks as
+        usual, so callers can clean up after it.
+        """
+        self._cancelled.set()
+        if not self.started and self.future is not None:
+            self.future.cancel()
+        if self._on_cancel:
+            self._on_cancel()
+
+
+class Engine:
+    """Event loop thread that runs blocking jobs with bounded concurrency"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.loop = asyncio.new_event_loop()
+        # One thread per slot, so the pool never grows with the number of clicks
+        self._executor = ThreadPoolExecutor(max_workers=sum(self.limits.values()), thread_name_prefix="engine")
+        self._semaphores = {}
+        self._jobs = set()
+        # Executor futures of running calls, awaited on shutdown
+        self._running = set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run_loop, name="engine-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _semaphore(self, kind):
+        # Created on the loop thread, where it is used
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.limits.get(kind, 1))
+        return self._semaphores[kind]
+
+    async def _run(self, job, func, args):
+        async with self._semaphore(job.kind):
+            if job.cancelled:
+                raise asyncio.CancelledError()
+            job.started = True
+            call = self.loop.run_in_executor(self._executor, func, *args)
+            self._running.add(call)
+            call.add_done_callback(self._running.discard)
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # A thread cannot be interrupted; keep its slot until it returns
+                await asyncio.wait([call])
+                raise
+
+    def submit(self, kind, func, *args, on_done=None, on_error=None, on_cancel=None):
+        """Run func(*args) on the engine and return its Job
+
+        on_done(result) and on_error(exception) are called on the engine
+        thread; wrap them with TkBridge.call to touch widgets. on_cancel is
+        called by Job.cancel() to make a running func return early.
+        """
+        if self._closed:
+            raise RuntimeError("Engine is shut down")
+        job = Job(kind, on_cancel)
+        self._jobs.add(job)
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, func, args), self.loop)
+
+        def finished(future):
+            self._jobs.discard(job)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                if on_done:
+                    on_done(future.result())
+            elif on_error:
+                on_error(error)
+        job.future.add_done_callback(finished)
+        return job
+
+    def busy(self, *kinds):
+        """Whether jobs of the given kinds (any kind if none given) are pending or running"""
+        return any(not kinds or job.kind in kinds for job in list(self._jobs))
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """Cancel every job and wait for running calls to return
+
+        Returns False if some call was still running when the timeout passed.
+        """
+        if self._closed:
+            return True
+        self._closed = True
+        for job in list(self._jobs):
+            job.cancel()
+
+        async def drain():
+            running = list(self._running)
+            if running:
+                _, pending = await asyncio.wait(running, timeout=timeout)
+                return not pending
+            return True
+        try:
+            stopped = asyncio.run_coroutine_threadsafe(drain(), self.loop).result(timeout + 1)
+        except Exception:
+            stopped = False
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(1)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return stopped
+
+
+class TkBridge:
+    """Queue of calls from background threads, run on the Tk thread by drain()"""
+
+    def __init__(self):
+        self._calls = queue.SimpleQueue()
+
+    def call(self, func, *args):
+        """Schedule func(*args) on the Tk thread; safe from any thread"""
+        self._calls.put((func, args))
+
+    def wrap(self, func):
+        """Return a callback that runs func on the Tk thread"""
+        return lambda *args: self.call(func, *args)
+
+    def drain(self):
+        """Run the queued calls; only call this from the Tk thread"""
+        while True:
+            try:
+                func, args = self._calls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                func(*args)
+            except Exception:
+                # Like Tk's own callbacks, report and keep the loop alive
+                traceback.print_exc()
@@ -0,0 +1,875 @@
+"""
+Anime Downloader GUI
+A modern GUI application for downloading anime using anipy-api
+The window is shown before anipy-api and the download modules are imported;
+load_backend() imports them and connects the providers in the background,
+so methods that need them import them locally.
+"""
+
+import tkinter as tk
+from tkinter import filedialog, messagebox
+import ttkbootstrap as tb
+from ttkbootstrap.constants import *
+import threading
+import os
+from pathlib import Path
+
+import startup
+import telemetry
+from engine import Engine, TkBridge
+from progress import ProgressBus, DRAIN_INTERVAL_MS
+
+
+# Result rows inserted per event-loop tick, so huge result lists never freeze the window
+RESULT_BATCH = 100
+# Episodes listed in the episode dropdown around the current one
+EPISODE_WINDOW = 100
+
+
+class AnimeDownloaderGUI:
+    def __init__(self):
+        # Create the main window with ttkbootstrap dark theme
+        self.root = tb.Window(themename="darkly")
+        self.root.title("Anime Downloader")
+        self.root.geometry("900x700")
+        self.root.resizable(True, True)
+        # Variables
+        self.search_results = []
+        self.search_generation = 0
+        self.results_fill = None
+        self.selected_anime = None
+        self.selected_result = None
+        self.episodes = []
+        self.episode_range = tk.StringVar()
+        self.episode_range.trace_add("write", lambda *args: self.update_range_count())
+        self.download_path = tk.StringVar(value=str(Path.home() / "Downloads"))
+        self.provider = None
+        self.providers = None
+        self.cache = None
+        self.stream_cache = None
+        self.journal = None
+        self.download_queue = []
+        # Set from the scheduler and hls defaults once the backend is loaded
+        self.max_workers = tk.IntVar(value=1)
+        self.speed_limit = tk.StringVar(value="0")
+        self.speed_limit.trace_add("write", lambda *args: self.apply_speed_limit())
+        self.parallel_segments = tk.BooleanVar(value=False)
+        self.ready = False
+        # refresh flag of a search started before the backend was ready
+        self.pending_search = None
+        self.scheduler = None
+        self.progress_bus = ProgressBus()
+        # All network work runs on the engine; results come back through the bridge
+        self.engine = Engine()
+        self.bridge = TkBridge()
+        self.search_job = None
+        self.closing = False
+        # Verification and remuxing run on their own process pool
+        self.post_processor = None
+        
+        self.init_telemetry()
+        
+        # Create GUI elements
+        with startup.phase("create widgets"):
+            self.create_widgets()
+        
+        # Configure grid weights for responsiveness
+        self.configure_grid()
+        
+        # Render download progress on a fixed timer
+        self.root.after(DRAIN_INTERVAL_MS, self.poll_progress)
+        self.root.after_idle(startup.mark, "window shown")
+        
+        # Import anipy-api and connect the providers while the window shows
+        self.update_status("Connecting to providers...")
+        self.engine.submit(
+            "startup", self.load_backend,
+            on_done=self.bridge.wrap(self.backend_ready),
+            on_error=self.bridge.wrap(self.backend_failed)
+        )
+        
+        # Stop downloads cleanly instead of killing them mid-write
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def load_backend(self):
+        """Import the download modules and open the providers; runs on the engine
+
+        Returns the provider pool, or the exception that stopped it.
+        """
+        with startup.phase("import anipy-api"):
+            import core  # noqa: F401
+        with startup.phase("import downloaders"):
+            import scheduler, streams, verify, watchlist  # noqa: F401
+        with startup.phase("open cache and journal"):
+            self.init_cache()
+            self.init_journal()
+        with startup.phase("init providers"):
+            return self.init_provider()
+
+    def init_provider(self):
+        """Initialize the anime providers; the first one is the primary"""
+        from providers import ProviderPool
+        try:
+            return ProviderPool()
+        except Exception as e:
+            return e
+
+    def backend_ready(self, providers):
+        """Enable the window once the backend is loaded; runs on the Tk thread"""
+        import core
+        import hls
+        from scheduler import DEFAULT_WORKERS, MAX_WORKERS
+        from verify import PostProcessor
+        self.quality_combobox['values'] = list(core.QUALITIES)
+        self.workers_spinbox.config(to=MAX_WORKERS)
+        self.max_workers.set(DEFAULT_WORKERS)
+        self.parallel_segments.set(bool(hls.segment_workers))
+        self.post_processor = PostProcessor()
+        self.ready = True
+        self.apply_speed_limit()
+        startup.mark("providers ready")
+        startup.report()
+        pending_search, self.pending_search = self.pending_search, None
+        if isinstance(providers, Exception):
+            self.update_status("Provider initialization failed")
+            messagebox.showerror("Error", f"Failed to initialize provider: {str(providers)}")
+            return
+        self.providers = providers
+        self.provider = providers.primary
+        self.update_status("Ready")
+        if pending_search is not None:
+            self.search_anime(refresh=pending_search)
+        # Offer to pick up batches an earlier run did not finish
+        self.offer_resume()
+
+    def backend_failed(self, e):
+        """Report a backend that could not even be imported"""
+        startup.report()
+        self.update_status("Failed to load anipy-api")
+        messagebox.showerror("Error", f"Failed to load anipy-api: {str(e)}")
+    
+    def init_telemetry(self):
+        """Start the span log, and metrics export when asked for in the environment"""
+        try:
+            telemetry.configure(
+                span_log=telemetry.default_span_log(),
+                metrics_file=os.environ.get("ANIME_DOWNLOADER_METRICS_FILE"),
+                metrics_port=os.environ.get("ANIME_DOWNLOADER_METRICS_PORT")
+            )
+        except Exception as e:
+            print("Telemetry unavailable:", e)
+
+    def init_cache(self):
+        """Open the on-disk search and episode cache"""
+        from cache import MetadataCache
+        from streams import StreamCache
+        try:
+            self.cache = MetadataCache()
+        except Exception as e:
+            # The app works without it, every lookup just goes to the provider
+            print("Metadata cache unavailable:", e)
+            self.cache = None
+        # Resolved streams are reused by repeated downloads until their URL expires
+        self.stream_cache = StreamCache(store=self.cache)
+    
+    def init_journal(self):
+        """Open the download job journal"""
+        from journal import JobJournal
+        try:
+            self.journal = JobJournal()
+        except Exception as e:
+            print("Download journal unavailable:", e)
+            self.journal = None
+    
+    def create_widgets(self):
+        """Create all GUI widgets"""
+        # Main container
+        main_frame = tb.Frame(self.root, padding=10)
+        main_frame.grid(row=0, column=0, sticky="nsew")
+        # Title
+        title_label = tb.Label(main_frame, text="Anime Downloader", font=("Segoe UI", 24, "bold"), bootstyle="info")
+        title_label.grid(row=0, column=0, columnspan=3, pady=(0, 20), sticky=tk.W)
+        # Search frame
+        search_frame = tb.Labelframe(main_frame, text="Search Anime", padding=10)
+        search_frame.grid(row=1, column=0, columnspan=3, sticky="we", pady=(0, 10))
+        tb.Label(search_frame, text="Anime Name:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.search_entry = tb.Entry(search_frame, width=40, font=("Segoe UI", 12))
+        self.search_entry.grid(row=0, column=1, sticky="we", padx=(0, 10))
+        self.search_entry.bind('<Return>', lambda event: self.search_anime())
+        search_btn = tb.Button(search_frame, text="Search", command=self.search_anime, bootstyle="primary")
+        search_btn.grid(row=0, column=2, padx=(10, 0))
+        refresh_btn = tb.Button(search_frame, text="Refresh", command=self.refresh, bootstyle="secondary")
+        refresh_btn.grid(row=0, column=3, padx=(10, 0))
+        # Results frame
+        results_frame = tb.Labelframe(main_frame, text="Search Results", padding=10)
+        results_frame.grid(row=2, column=0, columnspan=3, sticky="nsew", pady=(0, 10))
+        results_scrollbar = tb.Scrollbar(results_frame, bootstyle="round")
+        results_scrollbar.grid(row=0, column=1, sticky="ns")
+        # Treeview for results
+        self.results_treeview = tb.Treeview(results_frame, columns=("Anime", "Sources"), show="headings", height=8, bootstyle="dark")
+        self.results_treeview.heading("Anime", text="Anime (Languages)")
+        self.results_treeview.column("Anime", anchor="w", width=600, stretch=True)
+        self.results_treeview.heading("Sources", text="Sources")
+        self.results_treeview.column("Sources", anchor="w", width=200, stretch=False)
+        self.results_treeview.grid(row=0, column=0, sticky="nsew")
+        self.results_treeview.bind('<Double-1>', self.on_anime_select)
+        results_scrollbar.config(command=self.results_treeview.yview)
+        self.results_treeview.config(yscrollcommand=results_scrollbar.set)
+        # Anime details frame
+        details_frame = tb.Labelframe(main_frame, text="Anime Details", padding=10)
+        details_frame.grid(row=3, column=0, columnspan=3, sticky="we", pady=(0, 10))
+        self.anime_title_label = tb.Label(details_frame, text="Select an anime to see details")
+        self.anime_title_label.grid(row=0, column=0, columnspan=3, sticky=tk.W, pady=(0, 10))
+        episodes_frame = tb.Frame(details_frame)
+        episodes_frame.grid(row=1, column=0, columnspan=3, sticky="we", pady=(0, 10))
+        tb.Label(episodes_frame, text="Episode:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        # Lists a window of episodes around the typed one, long shows have thousands
+        self.episode_combobox = tb.Combobox(episodes_frame, width=15, postcommand=self.fill_episode_choices)
+        self.episode_combobox.grid(row=0, column=1, sticky=tk.W, padx=(0, 20))
+        tb.Label(episodes_frame, text="Language:").grid(row=0, column=2, sticky=tk.W, padx=(0, 10))
+        self.language_combobox = tb.Combobox(episodes_frame, state="readonly", width=15, values=["SUB", "DUB"])
+        self.language_combobox.grid(row=0, column=3, sticky=tk.W, padx=(0, 20))
+        self.language_combobox.set("SUB")
+        tb.Label(episodes_frame, text="Quality:").grid(row=0, column=4, sticky=tk.W, padx=(0, 10))
+        self.quality_combobox = tb.Combobox(episodes_frame, state="readonly", width=15)
+        self.quality_combobox.grid(row=0, column=5, sticky=tk.W)
+        self.quality_combobox.set("720")
+        tb.Label(episodes_frame, text="Episodes:").grid(row=1, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        self.range_entry = tb.Entry(episodes_frame, textvariable=self.episode_range, width=15)
+        self.range_entry.grid(row=1, column=1, sticky=tk.W, padx=(0, 20), pady=(10, 0))
+        self.range_label = tb.Label(episodes_frame, text="e.g. 1-50, 120- (empty = all)")
+        self.range_label.grid(row=1, column=2, columnspan=4, sticky=tk.W, pady=(10, 0))
+        # Download settings frame
+        download_frame = tb.Labelframe(main_frame, text="Download Settings", padding=10)
+        download_frame.grid(row=4, column=0, columnspan=3, sticky="we", pady=(0, 10))
+        tb.Label(download_frame, text="Download Path:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
+        self.path_entry = tb.Entry(download_frame, textvariable=self.download_path, width=50)
+        self.path_entry.grid(row=0, column=1, sticky="we", padx=(0, 10))
+        browse_btn = tb.Button(download_frame, text="Browse", command=self.browse_download_path, bootstyle="secondary")
+        browse_btn.grid(row=0, column=2)
+        tb.Label(download_frame, text="Parallel Downloads:").grid(row=1, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        self.workers_spinbox = tb.Spinbox(download_frame, from_=1, to=1, textvariable=self.max_workers, width=5, state="readonly")
+        self.workers_spinbox.grid(row=1, column=1, sticky=tk.W, pady=(10, 0))
+        tb.Label(download_frame, text="Speed Limit (KB/s):").grid(row=2, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        speed_frame = tb.Frame(download_frame)
+        speed_frame.grid(row=2, column=1, sticky=tk.W, pady=(10, 0))
+        tb.Spinbox(speed_frame, from_=0, to=1000000, increment=256, textvariable=self.speed_limit, width=10).grid(row=0, column=0)
+        tb.Label(speed_frame, text="0 = unlimited, applies to running downloads").grid(row=0, column=1, padx=(10, 0))
+        tb.Checkbutton(download_frame, text="Fetch HLS segments in parallel", variable=self.parallel_segments,
+                       command=self.apply_segment_mode, bootstyle="round-toggle").grid(row=3, column=1, sticky=tk.W, pady=(10, 0))
+        buttons_frame = tb.Frame(main_frame)
+        buttons_frame.grid(row=5, column=0, columnspan=3, pady=(10, 0), sticky="we")
+        self.download_episode_btn = tb.Button(buttons_frame, text="Download Episode", command=self.download_episode, state=tk.DISABLED, bootstyle="primary")
+        self.download_episode_btn.grid(row=0, column=0, padx=(0, 10))
+        self.download_all_btn = tb.Button(buttons_frame, text="Download Episodes", command=self.download_episodes, state=tk.DISABLED, bootstyle="primary")
+        self.download_all_btn.grid(row=0, column=1, padx=(0, 10))
+        self.pause_btn = tb.Button(buttons_frame, text="Pause", command=self.toggle_pause, state=tk.DISABLED, bootstyle="warning")
+        self.pause_btn.grid(row=0, column=2, padx=(0, 10))
+        self.cancel_btn = tb.Button(buttons_frame, text="Cancel", command=self.cancel_downloads, state=tk.DISABLED, bootstyle="danger")
+        self.cancel_btn.grid(row=0, column=3, padx=(0, 10))
+        self.watch_btn = tb.Button(buttons_frame, text="Add to Watchlist", command=self.add_to_watchlist, state=tk.DISABLED, bootstyle="info")
+        self.watch_btn.grid(row=0, column=4)
+        progress_frame = tb.Labelframe(main_frame, text="Download Progress", padding=10)
+        progress_frame.grid(row=6, column=0, columnspan=3, sticky="we", pady=(10, 0))
+        self.progress_label = tb.Label(progress_frame, text="Ready to download")
+        self.progress_label.grid(row=0, column=0, sticky=tk.W, pady=(0, 5))
+        self.progress_bar = tb.Progressbar(progress_frame, mode='determinate', bootstyle="success-striped")
+        self.progress_bar.grid(row=1, column=0, sticky="we")
+        self.status_label = tb.Label(main_frame, text="Ready", relief=tk.SUNKEN, anchor=tk.W)
+        self.status_label.grid(row=7, column=0, columnspan=3, sticky="we", pady=(10, 0))
+    
+    def configure_grid(self):
+        """Configure grid weights for responsive design"""
+        self.root.columnconfigure(0, weight=1)
+        self.root.rowconfigure(0, weight=1)
+        
+        # Main frame
+        main_frame = self.root.winfo_children()[0]
+        main_frame.columnconfigure(0, weight=1)
+        main_frame.rowconfigure(2, weight=1)  # Results frame
+        
+        # Results frame
+        for child in main_frame.winfo_children():
+            if isinstance(child, tb.Labelframe) and child.cget('text') == 'Search Results':
+                child.columnconfigure(0, weight=1)
+                child.rowconfigure(0, weight=1)
+                break
+        
+        # Search frame
+        for child in main_frame.winfo_children():
+            if isinstance(child, tb.Labelframe) and child.cget('text') == 'Search Anime':
+                child.columnconfigure(1, weight=1)
+                break
+        
+        # Download frame
+        for child in main_frame.winfo_children():
+            if isinstance(child, tb.Labelframe) and child.cget('text') == 'Download Settings':
+                child.columnconfigure(1, weight=1)
+                break
+        
+        # Progress frame
+        for child in main_frame.winfo_children():
+            if isinstance(child, tb.Labelframe) and child.cget('text') == 'Download Progress':
+                child.columnconfigure(0, weight=1)
+                break
+        
+        # Buttons frame
+        for child in main_frame.winfo_children():
+            if isinstance(child, tb.Frame) and len(child.winfo_children()) > 1:
+                for column in range(5):
+                    child.columnconfigure(column, weight=1)
+                break
+    
+    def update_status(self, message):
+        """Update the status bar"""
+        self.status_label.config(text=message)
+    
+    def poll_progress(self):
+        """Run queued engine callbacks and render the progress published since the last poll"""
+        try:
+            self.bridge.drain()
+            changed = self.progress_bus.drain()
+            status = changed.pop("status", None)
+            if status:
+                self.update_status(status["text"])
+            if changed:
+                self.render_progress(changed)
+        finally:
+            # A failing callback must not stop the polling for good
+            self.root.after(DRAIN_INTERVAL_MS, self.poll_progress)
+
+    def render_progress(self, changed):
+        """Show every running job together; a finished job stays until the next update
+
+        Jobs publish under their own key, ("episode", n) for single
+        downloads and "batch" for the batch, and set done when they end.
+        """
+        jobs = {key: state for key, state in self.progress_bus.snapshot().items() if key != "status"}
+        shown = [state for state in jobs.values() if not state.get("done")] or list(changed.values())[-1:]
+        if shown:
+            self.progress_bar.config(value=sum(state.get("value", 0) for state in shown) / len(shown))
+            self.progress_label.config(text="  |  ".join(state.get("text", "") for state in shown))
+        for key, state in jobs.items():
+            if state.get("done"):
+                self.progress_bus.discard(key)
+    
+    def search_anime(self, refresh=False):
+        """Search for anime, served from the cache unless refresh is set"""
+        search_query = self.search_entry.get().strip()
+        if not search_query:
+            messagebox.showwarning("Warning", "Please enter an anime name to search")
+            return
+        if not self.ready:
+            # backend_ready() runs it once the providers are connected
+            self.pending_search = refresh
+            self.update_status("Connecting to providers, searching when ready...")
+            return
+        if not self.provider:
+            messagebox.showerror("Error", "Provider not initialized.")
+            return
+        self.update_status("Searching...")
+        self.search_generation += 1
+        generation = self.search_generation
+        def show_results(results, detail):
+            # Drop answers that arrive after a newer search was started
+            if generation == self.search_generation:
+                self.update_search_results(results, detail)
+        def search_failed(e):
+            messagebox.showerror("Error", f"Search failed: {str(e)}")
+            self.update_status("Search failed")
+        # Set when a newer search supersedes this one
+        cancelled = threading.Event()
+        # Run search on the engine to avoid freezing GUI
+        def search():
+            answered = []
+            def on_results(results, provider_name, error):
+                answered.append(provider_name if error is None else f"{provider_name} failed")
+                # Show results as each provider answers
+                self.bridge.call(show_results, results, f"searched {', '.join(answered)}")
+            # linter: self.providers is not None here
+            return self.providers.search(search_query, self.cache, refresh=refresh, on_results=on_results,  # type: ignore
+                                         cancelled=cancelled)
+        # A search still waiting for its slot, or still waiting for slow
+        # providers, is superseded by this one and frees the slot
+        if self.search_job:
+            self.search_job.cancel()
+        self.search_job = self.engine.submit(
+            "search", search,
+            on_done=self.bridge.wrap(lambda results: show_results(results, f"from {len(self.providers.providers)} providers")),  # type: ignore
+            on_error=self.bridge.wrap(search_failed),
+            on_cancel=cancelled.set
+        )
+    
+    def update_search_results(self, results, detail=None):
+        """Update the search results listbox"""
+        self.search_results = results
+        self.results_treeview.delete(*self.results_treeview.get_children())
+        # Rows are added in batches; a newer update stops an unfinished fill
+        if self.results_fill:
+            self.root.after_cancel(self.results_fill)
+            self.results_fill = None
+        self.fill_results(results, 0)
+        self.update_status(f"Found {len(results)} results" + (f" ({detail})" if detail else ""))
+
+    def fill_results(self, results, start):
+        """Insert the next batch of result rows and schedule the rest"""
+        end = min(start + RESULT_BATCH, len(results))
+        for index in range(start, end):
+            result = results[index]
+            # Display anime name, available languages and the providers that have it
+            languages = ", ".join(sorted(lang.name for lang in result.languages))
+            display_text = f"{result.name} ({languages})"
+            sources = ", ".join(getattr(result, 'provider_names', ()))
+            # The row id is the index into search_results
+            self.results_treeview.insert("", tk.END, iid=str(index), values=(display_text, sources))
+        self.results_fill = self.root.after(1, self.fill_results, results, end) if end < len(results) else None
+    
+    def on_anime_select(self, event):
+        """Handle anime selection from results"""
+        selection = self.results_treeview.selection()
+        if not selection:
+            return
+        index = int(selection[0])
+        if index >= len(self.search_results):
+            return
+        result = self.search_results[index]
+        if not self.provider:
+            messagebox.showerror("Error", "Provider not initialized.")
+            return
+
+        try:
+            self.selected_anime = self.providers.anime_from_result(result)  # type: ignore
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to create Anime object: {e}")
+            return
+        self.selected_result = result
+        self.load_anime_details()
+
+    def load_anime_details(self, refresh=False):
+        """Load the episode list of the selected anime in the background"""
+        anime = self.selected_anime
+        result = self.selected_result
+        if anime is None:
+            return
+        self.update_status("Loading anime details...")
+        def details_failed(e):
+            messagebox.showerror("Error", f"Failed to load anime details: {str(e)}")
+            self.update_status("Failed to load details")
+        # Load anime details in background
+        def load_details():
+            import core
+            lang = core.default_language(anime.languages)
+            return core.get_episodes(anime, lang, self.cache, refresh=refresh)
+        self.engine.submit(
+            "details", load_details,
+            on_done=self.bridge.wrap(lambda episodes: self.update_anime_details(result, episodes)),
+            on_error=self.bridge.wrap(details_failed)
+        )
+    
+    def refresh(self):
+        """Repeat the search and reload the selected anime, bypassing the cache"""
+        if self.search_entry.get().strip():
+            self.search_anime(refresh=True)
+        if self.selected_anime is not None:
+            self.load_anime_details(refresh=True)
+    
+    def update_anime_details(self, result, episodes):
+        """Update anime details display"""
+        self.episodes = episodes
+        
+        # Update title
+        self.anime_title_label.config(text=result.name)
+        
+        # The dropdown is filled when it opens, around the current episode
+        self.episode_combobox['values'] = ()
+        self.episode_combobox.set(f"Episode {episodes[0]}" if episodes else "")
+        self.episode_range.set("")
+        
+        # Update language dropdown based on available languages
+        available_langs = [lang.name for lang in result.languages]
+        self.language_combobox['values'] = available_langs
+        if available_langs:
+            self.language_combobox.set(available_langs[0])
+        
+        # Enable download buttons
+        self.download_episode_btn.config(state=tk.NORMAL)
+        self.download_all_btn.config(state=tk.NORMAL)
+        self.watch_btn.config(state=tk.NORMAL)
+        
+        self.update_status(f"Anime details loaded ({len(episodes)} episodes)")
+
+    def selected_episode(self):
+        """The episode typed or picked in the episode dropdown, or None"""
+        text = self.episode_combobox.get().strip()
+        if not text:
+            return None
+        try:
+            number = float(text.split()[-1])
+        except ValueError:
+            return None
+        return next((episode for episode in self.episodes if float(episode) == number), None)
+
+    def fill_episode_choices(self):
+        """List the episodes around the current one when the dropdown opens"""
+        if not self.episodes:
+            return
+        current = self.selected_episode()
+        index = self.episodes.index(current) if current is not None else 0
+        start = max(0, min(index - EPISODE_WINDOW // 2, len(self.episodes) - EPISODE_WINDOW))
+        self.episode_combobox['values'] = [f"Episode {ep}" for ep in self.episodes[start:start + EPISODE_WINDOW]]
+
+    def selected_episodes(self):
+        """Episodes matching the range entry; raises ValueError for an invalid range"""
+        import core
+        return core.parse_episode_range(self.episode_range.get(), self.episodes)
+
+    def update_range_count(self):
+        """Show how many episodes the range entry selects"""
+        if not self.episodes:
+            return
+        try:
+            count = len(self.selected_episodes())
+        except ValueError:
+            self.range_label.config(text="Invalid range, e.g. 1-50, 120-")
+            return
+        self.range_label.config(text=f"{count} of {len(self.episodes)} episodes (e.g. 1-50, 120-; empty = all)")
+    
+    def apply_speed_limit(self):
+        """Apply the speed limit entry to the shared bandwidth limiter"""
+        if not self.ready:
+            # Applied by backend_ready()
+            return
+        import network
+        try:
+            limit = max(0, int(float(self.speed_limit.get() or 0)))
+        except ValueError:
+            return
+        network.limiter.set_rate(limit * 1024)
+    
+    def apply_segment_mode(self):
+        """Switch HLS downloads between segment-parallel and anipy-api's downloader"""
+        if not self.ready:
+            return
+        import hls
+        hls.configure(hls.DEFAULT_SEGMENT_WORKERS if self.parallel_segments.get() else 0)
+    
+    def add_to_watchlist(self):
+        """Follow the selected anime so 'main.py sync' downloads new episodes"""
+        from watchlist import Watchlist
+        if not self.selected_anime:
+            messagebox.showwarning("Warning", "Please select an anime first")
+            return
+        lang, quality, download_dir = self.download_settings()
+        if lang is None or quality is None or download_dir is None:
+            messagebox.showwarning("Warning", "Incomplete download settings.")
+            return
+        try:
+            Watchlist().add(self.selected_anime, lang, quality, download_dir)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update watchlist: {e}")
+            return
+        self.update_status(f"Watching {self.selected_anime.name} ({lang.name}, {quality}p)")
+    
+    def browse_download_path(self):
+        """Browse for download directory"""
+        folder_path = filedialog.askdirectory(initialdir=self.download_path.get())
+        if folder_path:
+            self.download_path.set(folder_path)
+    
+    def get_current_settings(self):
+        """Get current download settings; the episode is None when the dropdown names none"""
+        return (self.selected_episode(), *self.download_settings())
+
+    def download_settings(self):
+        """Language, quality and download directory, without the selected episode"""
+        import core
+        # Get language
+        lang_text = self.language_combobox.get()
+        lang = core.parse_language(lang_text)
+        
+        # Get quality
+        quality = int(self.quality_combobox.get())
+        
+        # Get download path
+        download_dir = Path(self.download_path.get())
+        
+        return lang, quality, download_dir
+    
+    def download_episode(self):
+        """Download selected episode"""
+        import core
+        from scheduler import DownloadCancelled
+        from verify import VerificationError, VERIFY_ATTEMPTS
+        if not self.selected_anime:
+            messagebox.showwarning("Warning", "Please select an anime first")
+            return
+        settings = self.get_current_settings()
+        if settings[0] is None:
+            messagebox.showwarning("Warning", "Please pick an episode from the list")
+            return
+        if not all(settings[1:]):
+            messagebox.showwarning("Warning", "Please select all download settings")
+            return
+        episode_num, lang, quality, download_dir = settings
+        if episode_num is None or lang is None or quality is None or download_dir is None:
+            messagebox.showwarning("Warning", "Incomplete download settings.")
+            return
+        anime = self.selected_anime
+        filename = core.episode_filename(self.get_anime_name(), episode_num)
+        cancelled = threading.Event()
+        # Progress of this download, rendered next to any other running job
+        job = ("episode", episode_num)
+        # Start download on the engine
+        def download_job(attempt=1):
+            try:
+                self.progress_bus.publish("status", text=f"Downloading Episode {episode_num}...")
+                self.progress_bus.publish(job, value=0, done=False, text=f"Preparing Episode {episode_num}...")
+                # Get video stream; timing and errors go to the span log
+                try:
+                    stream, _ = self.stream_cache.resolve(anime, episode_num, lang, quality)  # type: ignore
+                except (IndexError, LookupError):
+                    stream = None
+                except Exception as e:
+                    self.bridge.call(messagebox.showerror, "Error", f"Error getting stream: {e}")
+                    self.progress_bus.publish("status", text="Download failed")
+                    self.progress_bus.publish(job, value=0, text=f"Episode {episode_num} failed", done=True)
+                    return
+
+                if not stream:
+                    self.bridge.call(messagebox.showerror, "Error", f"No stream found for Episode {episode_num} ({lang.name}, {quality}p)")
+                    self.progress_bus.publish("status", text="No stream found")
+                    self.progress_bus.publish(job, value=0, text=f"Episode {episode_num} failed", done=True)
+                    return
+
+                # Create downloader with callbacks
+                def progress_callback(percentage):
+                    if cancelled.is_set():
+                        # Unwinds through anipy-api's interrupt handling, which deletes the partial file
+                        raise DownloadCancelled()
+                    self.progress_bus.publish(job, value=percentage, text=f"Downloading Episode {episode_num}: {percentage:.1f}%")
+                def info_callback(message, exc_info=None):
+                    self.progress_bus.publish("status", text=message)
+                def error_callback(message, exc_info=None):
+                    self.progress_bus.publish("status", text=f"Warning: {message}")
+                # Download; the post-processor remuxes it into .mkv
+                try:
+                    raw_path = core.download_stream(stream, download_dir / filename,
+                                                    progress_callback, info_callback, error_callback, container=None)
+                except Exception:
+                    # Resolve a fresh stream on the next attempt
+                    self.stream_cache.invalidate(anime, episode_num, lang, quality)  # type: ignore
+                    raise
+                self.progress_bus.publish("status", text=f"Verifying Episode {episode_num}...")
+                result = self.post_processor.submit(raw_path, ".mkv").result()
+                if not result["ok"]:
+                    if not result["retry"]:
+                        raise VerificationError(result["error"])
+                    # Truncated or damaged: download it again from a fresh stream
+                    Path(result["path"]).unlink(missing_ok=True)
+                    self.stream_cache.invalidate(anime, episode_num, lang, quality)  # type: ignore
+                    if attempt >= VERIFY_ATTEMPTS:
+                        raise VerificationError(result["error"])
+                    self.progress_bus.publish("status", text=f"Episode {episode_num} failed verification, downloading again")
+                    self.engine.submit("download", download_job, attempt + 1, on_cancel=cancelled.set)
+                    return
+                final_path = result["path"]
+                self.progress_bus.publish(job, value=100, text=f"Episode {episode_num} downloaded successfully!", done=True)
+                self.progress_bus.publish("status", text="Download completed")
+                self.bridge.call(messagebox.showinfo, "Success", f"Episode {episode_num} downloaded to:\n{final_path}")
+            except DownloadCancelled:
+                self.progress_bus.publish("status", text=f"Episode {episode_num} cancelled")
+                self.progress_bus.publish(job, value=0, text=f"Episode {episode_num} cancelled", done=True)
+            except Exception as e:
+                self.bridge.call(messagebox.showerror, "Error", f"Download failed: {str(e)}")
+                self.progress_bus.publish("status", text="Download failed")
+                self.progress_bus.publish(job, value=0, text=f"Episode {episode_num} failed", done=True)
+        if self.engine.busy("download"):
+            self.update_status(f"Episode {episode_num} queued")
+        self.engine.submit("download", download_job, on_cancel=cancelled.set)
+    
+    def download_episodes(self):
+        """Download the episodes selected by the range entry, all of them if it is empty"""
+        if not self.selected_anime or not self.episodes:
+            messagebox.showwarning("Warning", "Please select an anime first")
+            return
+        try:
+            episodes = self.selected_episodes()
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        if not episodes:
+            messagebox.showwarning("Warning", "No episodes match the selected range")
+            return
+        # Confirm download
+        which = "all" if len(episodes) == len(self.episodes) else f"{len(episodes)} of {len(self.episodes)}"
+        result = messagebox.askyesno("Confirm", f"Download {which} episodes ({episodes[0]}-{episodes[-1]})?")
+        if not result:
+            return
+        settings = self.download_settings()
+        if not all(settings):
+            messagebox.showwarning("Warning", "Please select language, quality and download path")
+            return
+        lang, quality, download_dir = settings
+        if lang is None or quality is None or download_dir is None:
+            messagebox.showwarning("Warning", "Incomplete download settings.")
+            return
+        anime_name = self.get_anime_name()
+        job_id = self.journal.create_job(self.selected_anime, lang, quality, download_dir, anime_name, episodes) if self.journal else None
+        self.start_batch(self.selected_anime, episodes, lang, quality, download_dir, anime_name, job_id)
+
+    def start_batch(self, anime, episodes, lang, quality, download_dir, anime_name, job_id=None):
+        """Run a batch of episode downloads in the background"""
+        from scheduler import DownloadScheduler
+        total_episodes = len(episodes)
+        finished = []
+        failed = []
+        active = {}
+        active_lock = threading.Lock()
+
+        def progress_callback(episode_num, percentage, overall):
+            with active_lock:
+                if percentage >= 100:
+                    active.pop(episode_num, None)
+                else:
+                    active[episode_num] = percentage
+                running = ", ".join(f"Ep {e}: {p:.0f}%" for e, p in list(active.items())[:4])
+            self.progress_bus.publish("batch", value=overall, text=f"{len(finished)}/{total_episodes} done  {running}", done=False)
+        def episode_done(episode_num, path):
+            finished.append(episode_num)
+        def episode_failed(episode_num, error):
+            failed.append(f"Episode {episode_num}: {error}")
+        def state_callback(episode_num, state):
+            if job_id:
+                self.journal.record(job_id, episode_num, state)  # type: ignore
+
+        self.scheduler = DownloadScheduler(
+            anime, lang, quality, download_dir,
+            anime_name=anime_name,
+            max_workers=self.max_workers.get(),
+            on_progress=progress_callback,
+            on_episode_done=episode_done,
+            on_episode_failed=episode_failed,
+            on_state=state_callback,
+            stream_cache=self.stream_cache,
+            post_processor=self.post_processor
+        )
+        scheduler = self.scheduler
+        self.set_batch_running(True)
+        # Run the batch on the engine; closing the window cancels it
+        def batch_job():
+            try:
+                scheduler.run(episodes)
+                if job_id and not self.closing:
+                    # Only a crash or closing the app leaves a job open for resuming
+                    self.journal.close_job(job_id)  # type: ignore
+                if scheduler.cancelled:
+                    self.progress_bus.publish("batch", text=f"Cancelled after {len(finished)}/{total_episodes} episodes", done=True)
+                    self.progress_bus.publish("status", text="Downloads cancelled")
+                elif failed:
+                    self.progress_bus.publish("batch", text=f"{len(finished)}/{total_episodes} episodes downloaded", done=True)
+                    self.progress_bus.publish("status", text=f"{len(failed)} downloads failed")
+                    self.bridge.call(messagebox.showerror, "Error", "Failed to download:\n" + "\n".join(failed))
+                else:
+                    self.progress_bus.publish("batch", value=100, text="All episodes downloaded!", done=True)
+                    self.progress_bus.publish("status", text="All downloads completed")
+                    self.bridge.call(messagebox.showinfo, "Success", f"All episodes downloaded to:\n{download_dir}")
+            except Exception as e:
+                if job_id and not self.closing:
+                    # e.g. not enough free space; resuming would only fail the same way
+                    self.journal.close_job(job_id)  # type: ignore
+                self.bridge.call(messagebox.showerror, "Error", f"Download failed: {str(e)}")
+                self.progress_bus.publish("status", text="Download failed")
+                self.progress_bus.publish("batch", value=0, text="Download failed", done=True)
+            finally:
+                self.bridge.call(self.set_batch_running, False)
+                # Other unfinished jobs, never the one that just ended
+                self.bridge.call(self.offer_resume, (job_id,))
+        self.engine.submit("batch", batch_job, on_cancel=scheduler.cancel)
+
+    def offer_resume(self, skip=()):
+        """Offer to resume a download job left unfinished by a previous run, except those in skip"""
+        if not self.journal or self.scheduler or not self.provider:
+            return
+        import core
+        from anipy_api.provider import LanguageTypeEnum
+        jobs = [job for job in self.journal.unfinished_jobs() if job["job"] not in skip]
+        if not jobs:
+            return
+        job = jobs[0]
+        remaining = job["remaining"]
+        if not messagebox.askyesno("Resume Downloads", f"{job['name']} has {len(remaining)} unfinished episodes in:\n{job['download_dir']}\n\nResume downloading them?"):
+            self.journal.close_job(job["job"])
+            self.root.after(0, self.offer_resume, skip)
+            return
+        try:
+            anime = core.anime_from_record(job, self.provider)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to resume downloads: {e}")
+            return
+        self.update_status(f"Resuming {job['name']}...")
+        self.start_batch(anime, remaining, LanguageTypeEnum(job["lang"]), job["quality"],
+                         Path(job["download_dir"]), job["anime_name"], job["job"])
+
+    def get_anime_name(self):
+        """Get the name of the selected anime for file names"""
+        selection = self.results_treeview.selection()
+        if selection:
+            index = int(selection[0])
+            if index < len(self.search_results):
+                return getattr(self.search_results[index], 'name', 'Anime')
+        if self.selected_anime is not None:
+            return getattr(self.selected_anime, 'name', 'Anime')
+        return 'Anime'
+
+    def set_batch_running(self, running):
+        """Toggle the download buttons for a running batch"""
+        state = tk.DISABLED if running else tk.NORMAL
+        self.download_episode_btn.config(state=state)
+        self.download_all_btn.config(state=state)
+        self.workers_spinbox.config(state=tk.DISABLED if running else "readonly")
+        self.pause_btn.config(state=tk.NORMAL if running else tk.DISABLED, text="Pause")
+        self.cancel_btn.config(state=tk.NORMAL if running else tk.DISABLED)
+        if not running:
+            self.scheduler = None
+
+    def toggle_pause(self):
+        """Pause or resume the running batch"""
+        if not self.scheduler:
+            return
+        if self.scheduler.paused:
+            self.scheduler.resume()
+            self.pause_btn.config(text="Pause")
+            self.update_status("Downloads resumed")
+        else:
+            self.scheduler.pause()
+            self.pause_btn.config(text="Resume")
+            self.update_status("Downloads paused")
+
+    def cancel_downloads(self):
+        """Cancel the running batch"""
+        if not self.scheduler:
+            return
+        self.scheduler.cancel()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.pause_btn.config(state=tk.DISABLED)
+        self.update_status("Cancelling downloads...")
+    
+    def on_close(self):
+        """Stop running downloads, letting them remove their partial files, then quit"""
+        if self.engine.busy("download", "batch"):
+            if not messagebox.askyesno("Quit", "Downloads are still running. Stop them and quit?\n\nUnfinished batches can be resumed on the next start."):
+                return
+        self.closing = True
+        self.update_status("Stopping downloads...")
+        self.root.update_idletasks()
+        if not self.engine.shutdown():
+            print("Some downloads did not stop in time")
+        if self.post_processor:
+            self.post_processor.shutdown(wait=False)
+        if self.cache:
+            self.cache.close()
+        self.root.destroy()
+
+    def run(self):
+        """Start the GUI application"""
+        self.root.mainloop()
\ No newline at end of file
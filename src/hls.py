@@ -0,0 +1,130 @@
+"""
+Segment-parallel HLS downloader
+Fetches the segments of an m3u8 stream on a bounded worker pool, retrying
+each segment on its own, and appends them to the output in playlist order.
+Only a small window of segments is held in memory at a time and no shared
+temp folder is used, so several episodes can download into one directory.
+Output goes to a preallocated .part file that is renamed once complete.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urljoin
+
+import m3u8
+from anipy_api.error import DownloadError
+
+import storage
+import telemetry
+
+
+DEFAULT_SEGMENT_WORKERS = 8
+SEGMENT_RETRIES = 3
+# Segments fetched ahead of the write cursor, per worker
+WINDOW_PER_WORKER = 2
+
+# Segment workers used for HLS downloads, 0 falls back to anipy-api's downloader
+segment_workers = DEFAULT_SEGMENT_WORKERS
+
+
+def configure(workers):
+    """Set the number of segment workers, 0 to disable segment-parallel downloads"""
+    global segment_workers
+    segment_workers = max(0, int(workers))
+
+
+def load_playlist(session, stream):
+    """Fetch the media playlist of a stream, following a variant playlist"""
+    headers = {"Referer": stream.referrer}
+    res = session.get(stream.url, headers=headers)
+    res.raise_for_status()
+    playlist = m3u8.M3U8(res.text, base_uri=urljoin(res.url, "."))
+    if playlist.is_variant:
+        variants = sorted(playlist.playlists, key=lambda p: p.stream_info.bandwidth or 0)
+        chosen = next((p for p in variants if p.stream_info.resolution and p.stream_info.resolution[1] == stream.resolution),
+                      variants[-1])
+        res = session.get(urljoin(playlist.base_uri, chosen.uri), headers=headers)
+        res.raise_for_status()
+        playlist = m3u8.M3U8(res.text, base_uri=urljoin(res.url, "."))
+    return playlist
+
+
+def is_encrypted(playlist):
+    return any(key and key.method and key.method.upper() != "NONE" for key in playlist.keys)
+
+
+def fetch_segment(session, url, referrer, retries=SEGMENT_RETRIES):
+    """Download one segment, retrying it with backoff"""
+    for attempt in range(retries):
+        try:
+            res = session.get(url, headers={"Referer": referrer})
+            res.raise_for_status()
+            return res.content
+        except Exception as e:
+            if attempt == retries - 1:
+                raise DownloadError(f"Segment failed after {retries} tries: {url}: {e}")
+            telemetry.event("segment_retry", url=url, attempt=attempt + 1, error=str(e))
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def estimate_size(segments, first_size):
+    """Playlist size extrapolated from the size of its first segment"""
+    first = segments[0].duration
+    duration = sum(segment.duration or 0 for segment in segments)
+    if first and duration:
+        return int(first_size / first * duration)
+    return first_size * len(segments)
+
+
+def download_segments(session, stream, download_path, playlist, workers=DEFAULT_SEGMENT_WORKERS,
+                      progress_callback=None, info_callback=None):
+    """Download an HLS media playlist into a .ts file next to download_path
+
+    Returns the .ts path, like anipy-api's m3u8_download.
+    """
+    progress_callback = progress_callback or (lambda percentage: None)
+    info_callback = info_callback or (lambda message, exc_info=None: None)
+    segments = list(playlist.segments)
+    if not segments:
+        raise DownloadError(f"Playlist has no segments: {stream.url}")
+    ts_path = Path(download_path).with_suffix(".ts")
+    part_path = storage.part_path(ts_path)
+    window = max(1, workers) * WINDOW_PER_WORKER
+    info_callback(f"Downloading {len(segments)} segments with {workers} workers")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="segment") as pool:
+        pending = deque()
+        upcoming = iter(segments)
+
+        def submit_next():
+            segment = next(upcoming, None)
+            if segment is not None:
+                url = urljoin(segment.base_uri or playlist.base_uri, segment.uri)
+                pending.append(pool.submit(fetch_segment, session, url, stream.referrer))
+
+        try:
+            for _ in range(window):
+                submit_next()
+            with part_path.open("wb") as out:
+                written = 0
+                while pending:
+                    data = pending.popleft().result()
+                    if not written:
+                        # Reserve the estimated size where there is room; only a guess, so it never fails
+                        storage.preallocate(out, estimate_size(segments, len(data)), estimated=True)
+                    out.write(data)
+                    written += 1
+                    submit_next()
+                    progress_callback(written / len(segments) * 100)
+                out.truncate()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            part_path.unlink(missing_ok=True)
+            raise
+
+    part_path.replace(ts_path)
+    info_callback("Segments downloaded")
+    return ts_path
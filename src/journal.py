@@ -0,0 +1,122 @@
+"""
+Download job journal
+Append-only JSON-lines record of batch jobs and the state of each episode,
+so that interrupted batches can be resumed on the next start
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from core import describe_anime
+from paths import user_data_dir
+
+
+PENDING = "pending"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+VERIFYING = "verifying"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, RESOLVING, DOWNLOADING, VERIFYING, DONE, FAILED)
+
+
+class JobJournal:
+    """Durable log of download jobs backed by a JSON-lines file"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else user_data_dir() / "jobs.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs = self._load()
+        self.compact()
+
+    def _load(self):
+        """Replay the journal into a dict of open jobs"""
+        jobs = {}
+        if not self.path.exists():
+            return jobs
+        with self.path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last line half written
+                    continue
+                job_id = entry.get("job")
+                if entry.get("type") == "job":
+                    jobs[job_id] = entry
+                elif entry.get("type") == "episode" and job_id in jobs:
+                    jobs[job_id]["states"][str(entry["episode"])] = entry["state"]
+                elif entry.get("type") == "closed":
+                    jobs.pop(job_id, None)
+        return jobs
+
+    def _append(self, entry):
+        with self.path.open("a", encoding="utf-8") as fp:
+            fp.write(json.dumps(entry) + "\n")
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def compact(self):
+        """Rewrite the journal so it only holds the open jobs"""
+        with self._lock:
+            tmp = self.path.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as fp:
+                for job in self._jobs.values():
+                    fp.write(json.dumps(job) + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp, self.path)
+
+    def create_job(self, anime, lang, quality, download_dir, anime_name, episodes):
+        """Record a new batch with every episode pending and return its id"""
+        job = {
+            "type": "job",
+            "job": uuid.uuid4().hex,
+            "created": time.time(),
+            **describe_anime(anime),
+            "lang": lang.value,
+            "quality": int(quality),
+            "download_dir": str(download_dir),
+            "anime_name": anime_name,
+            "episodes": list(episodes),
+            "states": {str(episode): PENDING for episode in episodes},
+        }
+        with self._lock:
+            self._jobs[job["job"]] = job
+            self._append(job)
+        return job["job"]
+
+    def record(self, job_id, episode, state):
+        """Record the new state of an episode"""
+        if state not in STATES:
+            raise ValueError(f"Unknown job state: {state}")
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["states"][str(episode)] = state
+            self._append({"type": "episode", "job": job_id, "episode": episode, "state": state})
+
+    def close_job(self, job_id):
+        """Mark a job as finished so it is no longer offered for resuming"""
+        with self._lock:
+            if self._jobs.pop(job_id, None) is not None:
+                self._append({"type": "closed", "job": job_id})
+
+    @staticmethod
+    def _remaining(job):
+        return [episode for episode in job["episodes"] if job["states"].get(str(episode)) != DONE]
+
+    def unfinished_jobs(self):
+        """Open jobs that still have episodes left, oldest first
+
+        Each job dict carries a "remaining" list of episodes not done yet.
+        """
+        with self._lock:
+            jobs = [dict(job, remaining=self._remaining(job)) for job in self._jobs.values()]
+        return sorted((job for job in jobs if job["remaining"]), key=lambda job: job["created"])
@@ -0,0 +1,253 @@
+"""
+Download networking
+One pooled HTTP session shared by every download, a global bandwidth cap
+that can be changed while downloads run, and a per-host connection limit
+"""
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urljoin
+
+import requests
+from anipy_api.download import Downloader
+from anipy_api.error import DownloadError
+from requests.adapters import HTTPAdapter, Retry
+
+import hls
+import storage
+import telemetry
+
+
+# Connections per host; HLS downloads fetch many segments from one CDN host
+DEFAULT_PER_HOST = 16
+# Host pools kept alive for reuse across episodes
+POOLED_HOSTS = 32
+# Bytes read per write of a progressive download
+CHUNK_SIZE = 64 * 1024
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all downloads; a rate of 0 means unlimited"""
+
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate):
+        """Change the cap in bytes per second, effective for the next chunk"""
+        with self._lock:
+            self._rate = max(0, int(rate or 0))
+            self._tokens = min(self._tokens, float(self._rate))
+            self._stamp = time.monotonic()
+
+    def consume(self, amount):
+        """Account for amount bytes, sleeping as long as the cap requires"""
+        with self._lock:
+            rate = self._rate
+            if not rate:
+                return
+            now = time.monotonic()
+            # Allow at most one second of burst
+            self._tokens = min(float(rate), self._tokens + (now - self._stamp) * rate)
+            self._stamp = now
+            self._tokens -= amount
+            delay = -self._tokens / rate if self._tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+class PooledSession(requests.Session):
+    """Session with a bounded connection pool per host and bandwidth throttling"""
+
+    def __init__(self, limiter, per_host=DEFAULT_PER_HOST):
+        super().__init__()
+        self.limiter = limiter
+        # pool_block makes a request wait for a free connection to its host
+        # instead of opening more than per_host of them
+        adapter = HTTPAdapter(
+            pool_connections=POOLED_HOSTS,
+            pool_maxsize=max(1, int(per_host)),
+            pool_block=True,
+            max_retries=Retry(connect=3, backoff_factor=0.5)
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.hooks["response"].append(self._throttle)
+
+    def _throttle(self, response, *args, **kwargs):
+        # Response.content reads through iter_content too, so this covers
+        # both streamed and buffered downloads
+        iter_content = response.iter_content
+
+        def throttled(chunk_size=1, decode_unicode=False):
+            for chunk in iter_content(chunk_size, decode_unicode):
+                self.limiter.consume(len(chunk))
+                telemetry.metrics.add_bytes(len(chunk))
+                yield chunk
+        response.iter_content = throttled
+        return response
+
+
+class _DiskFull(BaseException):
+    """Carries InsufficientSpace past anipy-api's retry loop, which retries every Exception"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+class PooledDownloader(Downloader):
+    """anipy-api Downloader that uses a shared session instead of its own"""
+
+    def __init__(self, session, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session.close()
+        self._session = session
+        # anipy-api reports failed attempts through this before retrying
+        soft_error_callback = self._soft_error_callback
+
+        def logged_soft_error(message, exc_info=None):
+            telemetry.event("download_warning", message=message)
+            soft_error_callback(message, exc_info)
+        self._soft_error_callback = logged_soft_error
+
+    def download(self, *args, **kwargs):
+        """anipy-api's download with its retries, except that a full disk is not retried"""
+        try:
+            return super().download(*args, **kwargs)
+        except _DiskFull as e:
+            raise e.error from None
+
+    def _download_single_try(self, stream, download_path, *args, **kwargs):
+        """One download attempt, timed so retries show up as separate spans"""
+        try:
+            with telemetry.span("download_attempt", episode=stream.episode):
+                return super()._download_single_try(stream, download_path, *args, **kwargs)
+        except storage.InsufficientSpace as e:
+            raise _DiskFull(e) from e
+
+    def ffmpeg_download(self, stream, download_path):
+        """Time ffmpeg runs; a local input means remuxing a finished download"""
+        name = "download_ffmpeg" if "://" in stream.url else "mux"
+        with telemetry.span(name, episode=stream.episode, container=download_path.suffix):
+            return super().ffmpeg_download(stream, download_path)
+
+    def mp4_download(self, stream, download_path):
+        """Download a progressive mp4 into a preallocated .part file, renamed once complete"""
+        path = download_path.with_suffix(".mp4")
+        part = storage.part_path(path)
+        res = self._session.get(stream.url, stream=True, headers={"Referer": stream.referrer})
+        res.raise_for_status()
+        total = int(res.headers.get("content-length", 0))
+        try:
+            with part.open("wb") as fp:
+                storage.preallocate(fp, total)
+                written = 0
+                for data in res.iter_content(chunk_size=CHUNK_SIZE):
+                    written += fp.write(data)
+                    if total:
+                        self._progress_callback(written / total * 100)
+                # Drop the preallocated tail if the server sent less
+                fp.truncate(written)
+            if total and written < total:
+                raise DownloadError(f"Connection closed after {written} of {total} bytes: {stream.url}")
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        finally:
+            res.close()
+        os.replace(part, path)
+        self._info_callback("Download finished.")
+        return path
+
+    def m3u8_download(self, stream, download_path):
+        """Download HLS through the segment-parallel downloader when enabled"""
+        if not hls.segment_workers:
+            return self._isolated_m3u8_download(stream, download_path)
+        playlist = hls.load_playlist(self._session, stream)
+        if hls.is_encrypted(playlist):
+            self._info_callback("Encrypted playlist, using FFMPEG downloader")
+            return self.ffmpeg_download(stream, download_path.with_suffix(".ts"))
+        return hls.download_segments(self._session, stream, download_path, playlist, hls.segment_workers,
+                                     self._progress_callback, self._info_callback)
+
+    def _isolated_m3u8_download(self, stream, download_path):
+        """Run anipy-api's m3u8 downloader in a directory of the episode's own
+
+        It keeps segments in a "temp" folder next to the output and deletes
+        that folder when done, which breaks parallel episodes sharing one
+        directory.
+        """
+        workdir = download_path.parent / f".{download_path.name}.hls"
+        workdir.mkdir(parents=True, exist_ok=True)
+        try:
+            path = super().m3u8_download(stream, workdir / download_path.name)
+            return Path(shutil.move(str(path), str(download_path.with_suffix(".ts"))))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def stream_size(stream, session=None):
+    """Size of a stream in bytes read from its headers or playlist, or None
+
+    HLS sizes are extrapolated from the first segment over the playlist's
+    duration.
+    """
+    session = session or get_session()
+    headers = {"Referer": stream.referrer}
+    try:
+        if stream.container == "hls":
+            playlist = hls.load_playlist(session, stream)
+            segments = list(playlist.segments)
+            if not segments:
+                return None
+            first = segments[0]
+            url = urljoin(first.base_uri or playlist.base_uri, first.uri)
+            with session.get(url, stream=True, headers=headers) as res:
+                res.raise_for_status()
+                size = int(res.headers.get("content-length", 0))
+            return hls.estimate_size(segments, size) if size else None
+        with session.get(stream.url, stream=True, headers=headers) as res:
+            res.raise_for_status()
+            return int(res.headers.get("content-length", 0)) or None
+    except Exception:
+        return None
+
+
+limiter = BandwidthLimiter()
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the session shared by all downloads"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession(limiter)
+        return _session
+
+
+def configure(max_rate=None, per_host=None):
+    """Set the bandwidth cap (bytes/sec, 0 = unlimited) and connections per host
+
+    Changing per_host replaces the shared session, which only affects
+    downloads started afterwards.
+    """
+    global _session
+    if max_rate is not None:
+        limiter.set_rate(max_rate)
+    if per_host is not None:
+        with _session_lock:
+            # Downloads still running keep the old session until they finish
+            _session = PooledSession(limiter, per_host)
@@ -0,0 +1,33 @@
+"""
+Application paths
+Per-user directories for cached and persistent application data
+"""
+
+import os
+import sys
+from pathlib import Path
+
+
+APP_NAME = "anime_downloader"
+
+
+def user_cache_dir():
+    """Get the per-user cache directory of the application"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / APP_NAME
+
+
+def user_data_dir():
+    """Get the per-user data directory of the application"""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or Path.home() / "AppData" / "Roaming"
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Application Support"
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share"
+    return Path(base) / APP_NAME
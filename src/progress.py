@@ -0,0 +1,45 @@
+"""
+Progress bus
+Download threads publish their latest state here without touching Tk; the
+GUI drains it on a fixed timer and only renders what changed since the last
+drain, so any number of progress ticks costs one redraw per interval.
+"""
+
+import threading
+
+
+# How often the GUI drains the bus
+DRAIN_INTERVAL_MS = 100
+
+
+class ProgressBus:
+    """Thread-safe store of the latest state per key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._changed = {}
+
+    def publish(self, key, **fields):
+        """Merge fields into the state of key; never blocks on the UI"""
+        with self._lock:
+            state = self._states.setdefault(key, {})
+            state.update(fields)
+            self._changed[key] = dict(state)
+
+    def drain(self):
+        """Return {key: state} for every key published since the last drain"""
+        with self._lock:
+            changed, self._changed = self._changed, {}
+        return changed
+
+    def snapshot(self):
+        """Return the latest state of every key"""
+        with self._lock:
+            return {key: dict(state) for key, state in self._states.items()}
+
+    def discard(self, key):
+        """Forget a finished job"""
+        with self._lock:
+            self._states.pop(key, None)
+            self._changed.pop(key, None)
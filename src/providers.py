@@ -0,0 +1,177 @@
+"""
+Multi-provider search
+Searches several anipy-api providers concurrently, merges results for the
+same title, and resolves streams with fallback to the other providers
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from anipy_api.provider import list_providers
+
+import core
+
+
+# Tried in this order for episode lists and streams
+DEFAULT_PROVIDERS = ("allanime", "animekai", "animehub", "anidbapp")
+DEFAULT_TIMEOUT = 15
+# How often a running search checks whether it was cancelled
+CANCEL_POLL = 0.1
+
+
+def available_providers():
+    """Names of the providers shipped with anipy-api"""
+    return [provider.NAME for provider in list_providers()]
+
+
+def title_key(name):
+    """Normalize a title so the same show from different providers matches"""
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+class MergedResult:
+    """One title found on one or more providers"""
+
+    def __init__(self, name):
+        self.name = name
+        self.languages = set()
+        # (provider, search result) pairs in provider priority order
+        self.sources = []
+
+    @property
+    def identifier(self):
+        return self.sources[0][1].identifier
+
+    @property
+    def provider_names(self):
+        return [provider.NAME for provider, _ in self.sources]
+
+    def add(self, provider, result):
+        self.sources.append((provider, result))
+        self.languages |= set(result.languages or ())
+
+
+class FallbackAnime:
+    """Anime available on several providers
+
+    Behaves like anipy-api's Anime for the primary provider, but moves on to
+    the next provider when one has no episodes or streams.
+    """
+
+    def __init__(self, animes):
+        self.animes = list(animes)
+        primary = self.animes[0]
+        self.provider = primary.provider
+        self.name = primary.name
+        self.identifier = primary.identifier
+        self.languages = set().union(*(anime.languages for anime in self.animes))
+
+    def _candidates(self, lang):
+        return [anime for anime in self.animes if lang in anime.languages] or self.animes
+
+    def get_episodes(self, lang):
+        error = None
+        for anime in self._candidates(lang):
+            try:
+                episodes = anime.get_episodes(lang=lang)
+            except Exception as e:
+                error = e
+                continue
+            if episodes:
+                return episodes
+        if error:
+            raise error
+        return []
+
+    def get_video(self, episode, lang, preferred_quality=None):
+        error = None
+        for anime in self._candidates(lang):
+            try:
+                stream = anime.get_video(episode, lang, preferred_quality=preferred_quality)
+            except Exception as e:
+                error = e
+                continue
+            if stream:
+                return stream
+        if error:
+            raise error
+        return None
+
+
+class ProviderPool:
+    """Fan searches out to several providers"""
+
+    def __init__(self, names=DEFAULT_PROVIDERS, timeout=DEFAULT_TIMEOUT):
+        available = available_providers()
+        self.providers = [core.init_provider(name) for name in names if name in available]
+        if not self.providers:
+            raise ValueError(f"None of the providers are available: {', '.join(names)}")
+        self.timeout = timeout
+
+    @property
+    def primary(self):
+        return self.providers[0]
+
+    def _merge(self, results_by_provider):
+        """Merge in provider priority order so the primary source comes first"""
+        merged = {}
+        for provider in self.providers:
+            for result in results_by_provider.get(provider.NAME, ()):
+                key = title_key(result.name)
+                if key not in merged:
+                    merged[key] = MergedResult(result.name)
+                merged[key].add(provider, result)
+        return list(merged.values())
+
+    def search(self, query, cache=None, refresh=False, on_results=None, cancelled=None):
+        """Search all providers; returns merged results
+
+        on_results(results, provider_name, error) is called from a worker
+        thread every time a provider answers, with the results merged so far.
+        Setting the cancelled event stops waiting for the providers that have
+        not answered yet and returns what was found so far.
+        """
+        on_results = on_results or (lambda results, provider_name, error: None)
+        results_by_provider = {}
+        errors = []
+        pool = ThreadPoolExecutor(max_workers=len(self.providers), thread_name_prefix="search")
+        futures = {pool.submit(core.search, provider, query, cache, refresh): provider for provider in self.providers}
+        deadline = time.monotonic() + self.timeout
+        pending = set(futures)
+        try:
+            while pending and not (cancelled and cancelled.is_set()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=min(remaining, CANCEL_POLL), return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = futures[future]
+                    try:
+                        results_by_provider[provider.NAME] = future.result()
+                        error = None
+                    except Exception as e:
+                        error = e
+                        errors.append(e)
+                    on_results(self._merge(results_by_provider), provider.NAME, error)
+            if not (cancelled and cancelled.is_set()):
+                # Report providers that did not answer in time like ones that failed
+                for future, provider in futures.items():
+                    if future not in pending:
+                        continue
+                    error = TimeoutError(f"{provider.NAME} did not answer within {self.timeout}s")
+                    errors.append(error)
+                    on_results(self._merge(results_by_provider), provider.NAME, error)
+        finally:
+            # Slow providers are abandoned, their threads finish in the background
+            pool.shutdown(wait=False, cancel_futures=True)
+        if errors and len(errors) == len(self.providers):
+            raise errors[0]
+        return self._merge(results_by_provider)
+
+    def anime_from_result(self, result):
+        """Build an anime for a search result, with fallback for merged results"""
+        if isinstance(result, MergedResult):
+            animes = [core.anime_from_result(provider, source) for provider, source in result.sources]
+            return animes[0] if len(animes) == 1 else FallbackAnime(animes)
+        return core.anime_from_result(self.primary, result)
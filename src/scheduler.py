@@ -0,0 +1,328 @@
+"""
+Download scheduler
+Resolves and downloads the episodes of a batch on a pool of worker threads.
+Streams are resolved by a single prefetching stage that stays a few episodes
+ahead of the download workers, so resolution never blocks a free worker.
+Before a batch starts its size is estimated and checked against free space;
+each episode goes to the download root with the most room.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import telemetry
+from core import download_stream, episode_filename, completed_download
+from journal import RESOLVING, DOWNLOADING, VERIFYING, DONE, FAILED
+from network import stream_size
+from storage import DownloadRoots, InsufficientSpace, fallback_size
+from streams import StreamCache
+from verify import VerificationError, VERIFY_ATTEMPTS
+
+
+DEFAULT_WORKERS = 3
+MAX_WORKERS = 8
+DEFAULT_PREFETCH = 2
+# How often a failing download is retried with a freshly resolved stream
+RESOLVE_ATTEMPTS = 2
+# Episodes whose stream size is looked up to estimate the size of a batch
+ESTIMATE_SAMPLE = 3
+
+
+class DownloadCancelled(KeyboardInterrupt):
+    """Raised inside a download when its batch is cancelled"""
+    # anipy-api only removes partial files and stops its segment pool on
+    # KeyboardInterrupt, so cancellation piggybacks on that path.
+
+
+class DownloadScheduler:
+    """Download a batch of episodes with a fixed number of parallel workers"""
+
+    def __init__(self, anime, lang, quality, download_dir, anime_name=None, max_workers=DEFAULT_WORKERS,
+                 prefetch=DEFAULT_PREFETCH, on_progress=None, on_episode_done=None, on_episode_failed=None,
+                 on_state=None, container=".mkv", stream_cache=None, post_processor=None,
+                 download_roots=None, check_space=True):
+        self.anime = anime
+        self.lang = lang
+        self.quality = quality
+        self.download_dir = download_dir
+        # Further directories episodes may be spread over by free space
+        self.roots = DownloadRoots([download_dir, *(download_roots or ())])
+        self.check_space = check_space
+        self.episode_size = fallback_size(quality)
+        self.anime_name = anime_name or getattr(anime, 'name', 'Anime')
+        self.max_workers = max(1, min(int(max_workers), MAX_WORKERS))
+        self.prefetch = max(1, int(prefetch))
+        self.container = container
+        # Shared with the caller so streams outlive the batch, e.g. for a retry
+        self.streams = stream_cache if stream_cache is not None else StreamCache()
+        # With a post-processor, downloads keep their original container and
+        # verification plus the remux run on its process pool
+        self.post_processor = post_processor
+        # Callbacks are invoked from worker threads
+        self.on_progress = on_progress or (lambda episode, percentage, overall: None)
+        self.on_episode_done = on_episode_done or (lambda episode, path: None)
+        self.on_episode_failed = on_episode_failed or (lambda episode, error: None)
+        self.on_state = on_state or (lambda episode, state: None)
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._verifying = 0
+        self._verified = threading.Condition(self._lock)
+        self._verify_attempts = {}
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def pause(self):
+        """Hold all workers at their next progress tick"""
+        self._running.clear()
+
+    def resume(self):
+        """Let paused workers continue"""
+        self._running.set()
+
+    def cancel(self):
+        """Stop the batch; running downloads are aborted and queued ones skipped"""
+        self._cancelled.set()
+        self._running.set()
+
+    def _checkpoint(self):
+        """Block while paused and abort if the batch was cancelled"""
+        while not self._running.wait(0.2):
+            pass
+        if self._cancelled.is_set():
+            raise DownloadCancelled()
+
+    def _report(self, episode, percentage):
+        with self._lock:
+            self._progress[episode] = percentage
+            overall = sum(self._progress.values()) / len(self._progress)
+        self.on_progress(episode, percentage, overall)
+
+    def _resolve(self, episode):
+        """Resolve the stream of an episode; returns (stream, expires)"""
+        return self.streams.resolve(self.anime, episode, self.lang, self.quality)
+
+    def target_path(self, episode, root=None):
+        """Path the episode is downloaded to in a root, the download directory by default"""
+        return Path(root or self.download_dir) / episode_filename(self.anime_name, episode)
+
+    def existing_download(self, episode):
+        """Path of a finished download of the episode in any root, or None"""
+        for root in self.roots.roots:
+            path = self.target_path(episode, root)
+            if completed_download(path):
+                return path
+        return None
+
+    def estimate(self, episodes):
+        """Estimated bytes needed for the episodes, from a sample of their streams"""
+        sizes = []
+        for episode in episodes[:ESTIMATE_SAMPLE]:
+            try:
+                stream, _ = self._resolve(episode)
+            except Exception:
+                continue
+            size = stream_size(stream)
+            if size:
+                sizes.append(size)
+        if sizes:
+            self.episode_size = sum(sizes) // len(sizes)
+        # Room for a raw download next to its remuxed copy in every worker
+        return self.episode_size * (len(episodes) + min(len(episodes), self.max_workers))
+
+    def _finish(self, episode, path, completed):
+        with self._lock:
+            completed.append(episode)
+        telemetry.metrics.inc("episodes_total", status=DONE)
+        self.on_state(episode, DONE)
+        self._report(episode, 100.0)
+        self.on_episode_done(episode, path)
+
+    def _fail(self, episode, error, failed):
+        with self._lock:
+            failed.append(episode)
+        telemetry.metrics.inc("episodes_total", status=FAILED)
+        telemetry.event("episode_failed", episode=episode, error=f"{type(error).__name__}: {error}")
+        self.on_state(episode, FAILED)
+        self.on_episode_failed(episode, error)
+
+    def _verify(self, episode, path, completed, failed, retry):
+        """Hand a download to the post-processor and handle its result when ready"""
+        self.on_state(episode, VERIFYING)
+        with self._lock:
+            self._verifying += 1
+
+        def verified(future):
+            try:
+                result = future.result()
+            except BaseException as e:
+                result = {"path": str(path), "ok": False, "retry": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                if result["ok"]:
+                    self._finish(episode, Path(result["path"]), completed)
+                    return
+                with self._lock:
+                    attempts = self._verify_attempts[episode] = self._verify_attempts.get(episode, 0) + 1
+                if result.get("retry"):
+                    # Truncated or damaged, the file is of no use
+                    Path(result["path"]).unlink(missing_ok=True)
+                if result.get("retry") and attempts < VERIFY_ATTEMPTS and not self._cancelled.is_set():
+                    # Download it again from a fresh stream
+                    self.streams.invalidate(self.anime, episode, self.lang, self.quality)
+                    telemetry.event("verify_retry", episode=episode, error=result["error"])
+                    with self._lock:
+                        retry.append(episode)
+                else:
+                    self._fail(episode, VerificationError(result["error"]), failed)
+            finally:
+                with self._lock:
+                    self._verifying -= 1
+                    self._verified.notify_all()
+        self.post_processor.submit(path, self.container).add_done_callback(verified)
+
+    def _wait_verified(self):
+        """Wait for outstanding verifications; a cancelled batch does not wait"""
+        with self._lock:
+            while self._verifying and not self._cancelled.is_set():
+                self._verified.wait(0.5)
+
+    def _resolve_ahead(self, episodes, ready, completed, failed):
+        """Resolver stage: fill the bounded queue with resolved streams"""
+        try:
+            for episode in episodes:
+                self._checkpoint()
+                try:
+                    existing = self.existing_download(episode)
+                    if existing:
+                        self._finish(episode, existing, completed)
+                        continue
+                    self.on_state(episode, RESOLVING)
+                except Exception as e:
+                    # e.g. the journal could not be written; the other episodes still go ahead
+                    self._fail(episode, e, failed)
+                    continue
+                try:
+                    stream, expires = self._resolve(episode)
+                except Exception as e:
+                    # The download stage resolves it again before giving up
+                    telemetry.event("resolve_retry", episode=episode, error=f"{type(e).__name__}: {e}")
+                    stream, expires = None, 0
+                ready.put((episode, stream, expires))
+                telemetry.metrics.set("queue_depth", ready.qsize())
+        except DownloadCancelled:
+            pass
+        finally:
+            for _ in range(self.max_workers):
+                ready.put(None)
+
+    def _download(self, episode, stream, expires):
+        """Download a single episode, re-resolving expired or failing streams"""
+        def progress_callback(percentage):
+            self._checkpoint()
+            self._report(episode, percentage)
+
+        def info_callback(message, exc_info=None):
+            telemetry.event("download_info", episode=episode, message=message)
+
+        for attempt in range(1, RESOLVE_ATTEMPTS + 1):
+            self._checkpoint()
+            if stream is None or time.time() >= expires:
+                stream, expires = self._resolve(episode)
+            self.on_state(episode, DOWNLOADING)
+            # Raises InsufficientSpace instead of starting a download that cannot fit;
+            # without the space check the guessed size must not stop a download
+            size = self.episode_size if self.check_space else 0
+            root = self.roots.reserve(size)
+            try:
+                return download_stream(stream, self.target_path(episode, root), progress_callback, info_callback,
+                                       container=None if self.post_processor else self.container)
+            except InsufficientSpace:
+                # The stream is fine, another attempt would only hit the full disk again
+                raise
+            except Exception as e:
+                # The URL may have expired or been revoked, never hand it out again
+                self.streams.invalidate(self.anime, episode, self.lang, self.quality)
+                if attempt == RESOLVE_ATTEMPTS:
+                    raise
+                telemetry.event("stream_retry", episode=episode, attempt=attempt, error=str(e))
+                stream = None
+            finally:
+                self.roots.release(root, size)
+
+    def _download_worker(self, ready, completed, failed, retry):
+        """Download stage: consume resolved streams until the resolver is done"""
+        while True:
+            item = ready.get()
+            telemetry.metrics.set("queue_depth", ready.qsize())
+            if item is None:
+                return
+            episode, stream, expires = item
+            if self._cancelled.is_set():
+                continue
+            telemetry.metrics.add("active_downloads", 1)
+            try:
+                path = self._download(episode, stream, expires)
+            except DownloadCancelled:
+                continue
+            except Exception as e:
+                self._fail(episode, e, failed)
+                continue
+            finally:
+                telemetry.metrics.add("active_downloads", -1)
+            if self.post_processor:
+                self._verify(episode, path, completed, failed, retry)
+            else:
+                self._finish(episode, path, completed)
+
+    def run(self, episodes):
+        """Download all episodes, blocking until the batch is finished or cancelled
+
+        Returns a (completed, failed) tuple of episode lists. Raises
+        InsufficientSpace before downloading anything if the batch will not fit.
+        """
+        episodes = list(episodes)
+        if self.check_space:
+            missing = [episode for episode in episodes if not self.existing_download(episode)]
+            needed = self.estimate(missing) if missing else 0
+            telemetry.event("space_check", episodes=len(missing), needed=needed, estimate=self.episode_size)
+            self.roots.check(needed)
+        with self._lock:
+            self._progress = {episode: 0.0 for episode in episodes}
+        completed, failed, retry = [], [], []
+        ready = queue.Queue(maxsize=self.prefetch)
+        telemetry.metrics.add("download_workers", self.max_workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers + 1, thread_name_prefix="episode") as pool:
+                resolver = pool.submit(self._resolve_ahead, episodes, ready, completed, failed)
+                while True:
+                    workers = [pool.submit(self._download_worker, ready, completed, failed, retry)
+                               for _ in range(self.max_workers)]
+                    for worker in workers:
+                        worker.result()
+                    # A resolver that died must not pass for a finished batch
+                    resolver.result()
+                    self._wait_verified()
+                    # Episodes that failed verification get another pass with fresh streams
+                    with self._lock:
+                        again, retry[:] = list(retry), []
+                    if not again or self._cancelled.is_set():
+                        break
+                    ready = queue.Queue()
+                    for episode in again:
+                        ready.put((episode, None, 0))
+                    for _ in range(self.max_workers):
+                        ready.put(None)
+        finally:
+            telemetry.metrics.add("download_workers", -self.max_workers)
+        return completed, failed
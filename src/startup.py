@@ -0,0 +1,70 @@
+"""
+Startup profiling
+Times imports and initialization steps from process start when enabled with
+--profile-startup, and reports them once so slow starts can be tracked
+"""
+
+import atexit
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+_started = time.perf_counter()
+_enabled = False
+_reported = False
+_lock = threading.Lock()
+# (name, seconds since start, duration) in the order the steps finished
+_phases = []
+
+
+def enable():
+    """Start recording; the report is printed at exit if nothing printed it earlier"""
+    global _enabled
+    _enabled = True
+    atexit.register(report)
+
+
+def enabled():
+    return _enabled
+
+
+@contextmanager
+def phase(name):
+    """Time a startup step, e.g. an import; safe from any thread"""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases.append((name, started - _started, time.perf_counter() - started))
+
+
+def mark(name):
+    """Record a point in time, e.g. the window being shown"""
+    if _enabled:
+        with _lock:
+            _phases.append((name, time.perf_counter() - _started, 0.0))
+
+
+def report(file=None):
+    """Print the recorded steps and log them as a "startup" telemetry event"""
+    global _reported
+    with _lock:
+        if not _enabled or _reported:
+            return
+        _reported = True
+        phases = list(_phases)
+    total = time.perf_counter() - _started
+    file = file or sys.stderr
+    print("Startup profile:            at   duration", file=file)
+    for name, at, duration in phases:
+        print(f"  {name:<24} {at:8.3f}s {duration:9.3f}s", file=file)
+    print(f"  {'total':<24} {total:8.3f}s", file=file)
+    import telemetry
+    telemetry.event("startup", total=round(total, 4),
+                    phases={name: round(duration or at, 4) for name, at, duration in phases})
@@ -0,0 +1,145 @@
+"""
+Download storage
+Free-space checks, preallocated .part files and placement of episodes across
+several download roots, so a full disk fails a download up front instead of
+leaving a truncated file behind
+"""
+
+import errno
+import os
+import shutil
+import threading
+from pathlib import Path
+
+
+# Kept free on every root, e.g. for the filesystem's own needs
+MIN_FREE = 512 * 1024 * 1024
+# Bitrates (bits per second) assumed when a stream does not tell its size
+FALLBACK_BITRATES = {1080: 4_000_000, 720: 2_500_000, 480: 1_200_000, 360: 800_000}
+# Typical episode length for the fallback estimate
+TYPICAL_DURATION = 24 * 60
+
+
+class InsufficientSpace(OSError):
+    """Not enough free space for a download or a batch"""
+
+
+def format_size(size):
+    """Human-readable byte count, e.g. "1.4 GB\""""
+    if abs(size) < 1024:
+        return f"{size:.0f} B"
+    for unit in ("KB", "MB", "GB"):
+        size /= 1024
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+    return f"{size / 1024:.1f} TB"
+
+
+def _existing(path):
+    """path, or its closest parent that exists, e.g. for a root not created yet"""
+    path = Path(path).absolute()
+    while not path.exists() and path.parent != path:
+        path = path.parent
+    return path
+
+
+def free_space(path):
+    """Free bytes on the filesystem of path"""
+    return shutil.disk_usage(_existing(path)).free
+
+
+def fallback_size(quality):
+    """Estimated episode size for a quality when the stream does not tell"""
+    try:
+        bitrate = FALLBACK_BITRATES.get(int(quality), FALLBACK_BITRATES[1080])
+    except (TypeError, ValueError):
+        bitrate = FALLBACK_BITRATES[1080]
+    return bitrate // 8 * TYPICAL_DURATION
+
+
+def part_path(path):
+    """The temporary name a file is written under until it is complete"""
+    path = Path(path)
+    return path.with_name(path.name + ".part")
+
+
+def preallocate(fp, size, estimated=False):
+    """Reserve size bytes for an open file where the filesystem supports it
+
+    Raises InsufficientSpace when the disk cannot hold the file. An
+    estimated size is only reserved as far as the free space allows and
+    never raises, as the guess may be too high. The caller truncates the file
+    to the bytes actually written when it is done.
+    """
+    if not size or not hasattr(os, "posix_fallocate"):
+        return
+    if estimated:
+        size = min(size, free_space(fp.name) - MIN_FREE)
+        if size <= 0:
+            return
+    try:
+        os.posix_fallocate(fp.fileno(), 0, int(size))
+    except OSError as e:
+        if e.errno in (errno.ENOSPC, errno.EDQUOT) and not estimated:
+            raise InsufficientSpace(e.errno, f"No room for {format_size(size)} on disk", str(fp.name)) from e
+        # EOPNOTSUPP/EINVAL on filesystems without preallocation; write normally
+
+
+class DownloadRoots:
+    """Download directories, of which each new download goes to the one with the most room"""
+
+    def __init__(self, roots, min_free=MIN_FREE):
+        roots = [Path(root) for root in roots]
+        # Keep the order but drop repeated roots
+        self.roots = list(dict.fromkeys(roots))
+        self.min_free = min_free
+        self._lock = threading.Lock()
+        # Bytes promised to downloads that are still running, per root
+        self._reserved = {root: 0 for root in self.roots}
+
+    @property
+    def primary(self):
+        return self.roots[0]
+
+    def available(self, root):
+        """Free bytes on a root, less the reserve and running downloads"""
+        return free_space(root) - self.min_free - self._reserved[root]
+
+    def total_available(self):
+        """Room across all roots; roots on one filesystem are only counted once"""
+        seen = set()
+        total = 0
+        for root in self.roots:
+            device = os.stat(_existing(root)).st_dev
+            if device in seen:
+                continue
+            seen.add(device)
+            total += max(0, self.available(root))
+        return total
+
+    def reserve(self, size):
+        """Pick the root with the most room for a download of size bytes and hold the space
+
+        Raises InsufficientSpace if no root can take it; a size of 0 only
+        picks the root. Pass the returned root to release() when the download
+        has finished or failed.
+        """
+        with self._lock:
+            rooms = [(self.available(root), root) for root in self.roots]
+            room, root = max(rooms, key=lambda entry: entry[0])
+            if size and room < size:
+                raise InsufficientSpace(f"No download root has room for {format_size(size)} "
+                                        f"(at most {format_size(max(0, room))} free)")
+            self._reserved[root] += size
+            return root
+
+    def release(self, root, size):
+        with self._lock:
+            self._reserved[root] = max(0, self._reserved[root] - size)
+
+    def check(self, needed):
+        """Raise InsufficientSpace if the roots cannot hold needed bytes"""
+        available = self.total_available()
+        if needed > available:
+            raise InsufficientSpace(f"Downloads need about {format_size(needed)}, "
+                                    f"only {format_size(max(0, available))} is free")
@@ -0,0 +1,140 @@
+"""
+Stream cache
+Resolved streams keyed by anime, episode, language and quality, kept until
+their signed URL is about to expire so retries and repeated downloads skip
+the provider round trips
+"""
+
+import re
+import threading
+import time
+from calendar import timegm
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+import core
+import telemetry
+
+
+DEFAULT_MAX_ENTRIES = 256
+# Lifetime assumed for URLs that do not say when they expire
+DEFAULT_TTL = 10 * 60
+# Upper bound for lifetimes read from a URL
+MAX_TTL = 6 * 60 * 60
+# A stream is treated as expired this long before its URL actually expires,
+# so a download is not started on a URL that dies halfway through the request
+EXPIRY_MARGIN = 60
+
+# Unix timestamps in common signed-URL parameters, e.g. "expires=1700000000",
+# "exp=..." or Akamai's "hdnts=exp=...~acl=..."
+EXPIRY_PATTERN = re.compile(r"(?<![a-z0-9_-])(?:expires?|expiry|exp|e|validto|deadline)=(\d{10,13})(?!\d)", re.I)
+
+
+def url_expiry(url):
+    """Unix time a signed URL expires at, or None if the URL does not tell"""
+    query = {key.lower(): values[-1] for key, values in parse_qs(urlsplit(url).query).items()}
+    if "x-amz-date" in query and "x-amz-expires" in query:
+        try:
+            signed = timegm(time.strptime(query["x-amz-date"], "%Y%m%dT%H%M%SZ"))
+            return signed + int(query["x-amz-expires"])
+        except ValueError:
+            pass
+    match = EXPIRY_PATTERN.search(url)
+    if match:
+        value = int(match.group(1))
+        # Millisecond timestamps have 13 digits
+        return value / 1000 if value > 10 ** 12 else value
+    return None
+
+
+def stream_expiry(stream, resolved_at=None):
+    """Unix time after which a stream should be resolved again"""
+    resolved_at = time.time() if resolved_at is None else resolved_at
+    expires = url_expiry(stream.url)
+    if expires is None:
+        return resolved_at + DEFAULT_TTL
+    return min(expires - EXPIRY_MARGIN, resolved_at + MAX_TTL)
+
+
+class StreamCache:
+    """LRU cache of resolved streams, optionally persisted in a MetadataCache"""
+
+    def __init__(self, store=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (stream, expires)
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(anime, episode, lang, quality):
+        return anime.provider.NAME, str(anime.identifier), str(episode), lang.value, str(quality)
+
+    @staticmethod
+    def _store_key(key):
+        _, identifier, episode, _, quality = key
+        return f"{identifier}:{episode}:{quality}"
+
+    def get(self, anime, episode, lang, quality):
+        """Return (stream, expires) for a cached stream that is still valid, or None"""
+        key = self._key(anime, episode, lang, quality)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+        if self.store is None:
+            return None
+        try:
+            entry = self.store.get("streams", key[0], self._store_key(key), lang)
+        except Exception:
+            return None
+        if entry is None or entry[1] <= now:
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, anime, episode, lang, quality, stream, resolved_at=None):
+        """Cache a freshly resolved stream; returns the time it expires"""
+        key = self._key(anime, episode, lang, quality)
+        entry = (stream, stream_expiry(stream, resolved_at))
+        self._remember(key, entry)
+        if self.store is not None:
+            try:
+                self.store.put("streams", key[0], self._store_key(key), entry, lang)
+            except Exception:
+                # Persisting is best effort, the memory cache still works
+                pass
+        return entry[1]
+
+    def invalidate(self, anime, episode, lang, quality):
+        """Forget a stream, e.g. after a download from its URL failed"""
+        key = self._key(anime, episode, lang, quality)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is not None:
+            try:
+                self.store.delete("streams", key[0], self._store_key(key), lang)
+            except Exception:
+                pass
+
+    def resolve(self, anime, episode, lang, quality, refresh=False):
+        """Return (stream, expires), resolving the stream only on a cache miss"""
+        if not refresh:
+            entry = self.get(anime, episode, lang, quality)
+            if entry is not None:
+                telemetry.metrics.inc("stream_cache_total", result="hit")
+                return entry
+        telemetry.metrics.inc("stream_cache_total", result="miss")
+        stream = core.resolve_stream(anime, episode, lang, quality)
+        return stream, self.put(anime, episode, lang, quality, stream)
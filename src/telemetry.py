@@ -0,0 +1,271 @@
+"""
+Download telemetry
+Timing spans for search, episode lists, stream resolution, downloads and
+muxing written to a JSON-lines log, plus counters and gauges exported in the
+Prometheus text format to a file or a local HTTP endpoint
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from paths import user_cache_dir
+
+
+METRIC_PREFIX = "anime_downloader"
+# The span log is rotated to a single .1 backup past this size
+SPAN_LOG_MAX_BYTES = 5 * 1024 * 1024
+# Seconds over which the download rate is averaged
+RATE_WINDOW = 10
+METRICS_FILE_INTERVAL = 5
+
+
+def default_span_log():
+    return user_cache_dir() / "spans.jsonl"
+
+
+class SpanLog:
+    """Append-only JSON-lines log shared by all threads"""
+
+    def __init__(self, path, max_bytes=SPAN_LOG_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._fp = self.path.open("a", encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._fp is None:
+                return
+            if self._fp.tell() > self.max_bytes:
+                self._fp.close()
+                os.replace(self.path, self.path.with_suffix(self.path.suffix + ".1"))
+                self._fp = self.path.open("a", encoding="utf-8")
+            self._fp.write(line + "\n")
+            self._fp.flush()
+
+    def close(self):
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+
+class Metrics:
+    """Counters, gauges and span timings, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        # (span, status) -> [count, total seconds]
+        self._spans = {}
+        self._bytes_total = 0
+        # [second, bytes] buckets for the download rate
+        self._rate = deque()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def add(self, name, delta, **labels):
+        """Move a gauge up or down"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, span, seconds, status):
+        with self._lock:
+            entry = self._spans.setdefault((span, status), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_bytes(self, amount):
+        """Account for downloaded bytes"""
+        second = int(time.monotonic())
+        with self._lock:
+            self._bytes_total += amount
+            if self._rate and self._rate[-1][0] == second:
+                self._rate[-1][1] += amount
+            else:
+                self._rate.append([second, amount])
+            while self._rate[0][0] <= second - RATE_WINDOW:
+                self._rate.popleft()
+
+    def bytes_per_second(self):
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(amount for second, amount in self._rate if second > now - RATE_WINDOW)
+        return recent / RATE_WINDOW
+
+    def render(self):
+        """Metrics in the Prometheus text exposition format"""
+        def series(name, labels, value):
+            text = ",".join(f'{key}="{label}"' for key, label in labels)
+            return f"{METRIC_PREFIX}_{name}{{{text}}} {value}" if text else f"{METRIC_PREFIX}_{name} {value}"
+
+        rate = self.bytes_per_second()
+        with self._lock:
+            lines = [
+                f"# TYPE {METRIC_PREFIX}_bytes_total counter",
+                series("bytes_total", (), self._bytes_total),
+                f"# TYPE {METRIC_PREFIX}_bytes_per_second gauge",
+                series("bytes_per_second", (), f"{rate:.1f}"),
+            ]
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                declared = set()
+                for (name, labels), value in sorted(values.items()):
+                    if name not in declared:
+                        declared.add(name)
+                        lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+                    lines.append(series(name, labels, value))
+            if self._spans:
+                lines.append(f"# TYPE {METRIC_PREFIX}_span_seconds summary")
+            for (span, status), (count, total) in sorted(self._spans.items()):
+                labels = (("span", span), ("status", status))
+                lines.append(series("span_seconds_count", labels, count))
+                lines.append(series("span_seconds_sum", labels, f"{total:.6f}"))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve /metrics on a local port"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, int(port)), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class MetricsFile:
+    """Rewrite a metrics text file on an interval, e.g. for node_exporter's textfile collector"""
+
+    def __init__(self, metrics, path, interval=METRICS_FILE_INTERVAL):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="metrics-file", daemon=True).start()
+
+    def write(self):
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(self.metrics.render(), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self._stop.set()
+        self.write()
+
+
+metrics = Metrics()
+_log = None
+_exporters = []
+_registered = False
+
+
+def configure(span_log=None, metrics_file=None, metrics_port=None):
+    """Start the span log and the metrics exporters that are given
+
+    Replaces whatever an earlier call set up.
+    """
+    global _log, _registered
+    shutdown()
+    if span_log:
+        _log = SpanLog(span_log)
+    if metrics_file:
+        _exporters.append(MetricsFile(metrics, metrics_file))
+    if metrics_port:
+        _exporters.append(MetricsServer(metrics, metrics_port))
+    if not _registered:
+        atexit.register(shutdown)
+        _registered = True
+
+
+def shutdown():
+    """Flush the metrics file and close the log and the endpoint"""
+    global _log
+    while _exporters:
+        _exporters.pop().close()
+    if _log is not None:
+        _log.close()
+        _log = None
+
+
+def _write(record):
+    log = _log
+    if log is not None:
+        log.write(dict(ts=round(time.time(), 3), thread=threading.current_thread().name, **record))
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a block; yields a dict the block can add fields to
+
+    Failures are counted per span name and logged with their error.
+    """
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except KeyboardInterrupt:
+        # Also covers cancelled downloads
+        status = "cancelled"
+        raise
+    except BaseException as e:
+        status = "error"
+        fields["error"] = f"{type(e).__name__}: {e}"
+        metrics.inc("failures_total", stage=name)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        metrics.observe(name, duration, status)
+        _write(dict(span=name, status=status, duration=round(duration, 6), **fields))
+
+
+def event(name, **fields):
+    """Log a point-in-time event such as a retry and count it"""
+    metrics.inc("events_total", event=name)
+    _write(dict(event=name, **fields))
@@ -0,0 +1,315 @@
+"""
+Post-download verification
+Checks finished downloads for truncation and missing streams, with ffprobe
+when it is installed and container header checks otherwise, and remuxes or
+transcodes them. The work runs on a process pool of its own, so verifying
+one episode overlaps with downloading the next.
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import struct
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import telemetry
+
+
+DEFAULT_POST_WORKERS = 2
+# How often an episode is downloaded again after failing verification
+VERIFY_ATTEMPTS = 2
+# Anything smaller is not a complete episode
+MIN_SIZE = 64 * 1024
+# Share of the advertised duration that must actually be readable
+MIN_DURATION_RATIO = 0.98
+PROBE_TIMEOUT = 60
+CONVERT_TIMEOUT = 6 * 60 * 60
+
+# ffmpeg arguments for optional transcoding after the download
+TRANSCODE_PRESETS = {
+    "hevc": ["-c:v", "libx265", "-crf", "26", "-preset", "medium", "-c:a", "copy", "-c:s", "copy"],
+    "h264": ["-c:v", "libx264", "-crf", "23", "-preset", "veryfast", "-c:a", "copy", "-c:s", "copy"],
+}
+
+TS_PACKET = 188
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+MKV_SEGMENT = b"\x18\x53\x80\x67"
+STATS_TIME = re.compile(r"time=\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class VerificationError(Exception):
+    """A file failed verification or post-processing"""
+
+
+def _result(path, ok, method, duration=None, error=None):
+    return {"path": str(path), "ok": ok, "method": method, "duration": duration, "error": error}
+
+
+def _ffprobe(path, ffprobe, ffmpeg):
+    res = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration:stream=codec_type", "-of", "json", str(path)],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT
+    )
+    if res.returncode < 0:
+        # Killed by a signal, i.e. ffprobe crashed; that says nothing about the file
+        return _result(path, False, "probe", error=f"ffprobe died with signal {-res.returncode}")
+    if res.returncode != 0:
+        return _result(path, False, "ffprobe", error=res.stderr.strip() or f"ffprobe exited with {res.returncode}")
+    info = json.loads(res.stdout or "{}")
+    duration = float(info.get("format", {}).get("duration") or 0)
+    kinds = {stream.get("codec_type") for stream in info.get("streams", [])}
+    if "video" not in kinds:
+        return _result(path, False, "ffprobe", duration, "no video stream")
+    if duration <= 0:
+        return _result(path, False, "ffprobe", duration, "unknown duration")
+    if not ffmpeg:
+        return _result(path, True, "ffprobe", duration)
+    # Read every packet; a truncated file ends well before its advertised duration
+    res = subprocess.run(
+        [ffmpeg, "-nostdin", "-v", "error", "-stats", "-i", str(path), "-map", "0", "-c", "copy", "-f", "null", "-"],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT * 10
+    )
+    times = STATS_TIME.findall(res.stderr)
+    read = int(times[-1][0]) * 3600 + int(times[-1][1]) * 60 + float(times[-1][2]) if times else 0.0
+    if res.returncode != 0:
+        lines = res.stderr.strip().splitlines()
+        return _result(path, False, "ffmpeg", duration, lines[-1] if lines else f"ffmpeg exited with {res.returncode}")
+    if read < duration * MIN_DURATION_RATIO:
+        return _result(path, False, "ffmpeg", duration, f"only {read:.0f}s of {duration:.0f}s readable")
+    return _result(path, True, "ffmpeg", duration)
+
+
+def _mp4_header(path, size):
+    """Walk the top-level boxes; every box must fit in the file and moov/mdat must exist"""
+    boxes = set()
+    duration = None
+    with open(path, "rb") as fp:
+        offset = 0
+        while offset < size:
+            fp.seek(offset)
+            header = fp.read(16)
+            if len(header) < 8:
+                return _result(path, False, "header", error=f"truncated box header at {offset}")
+            box_size, kind = struct.unpack(">I4s", header[:8])
+            if box_size == 1:
+                box_size = struct.unpack(">Q", header[8:16])[0]
+            elif box_size == 0:
+                box_size = size - offset
+            if box_size < 8 or offset + box_size > size:
+                return _result(path, False, "header", error=f"{kind.decode('latin-1')} box runs past the end of the file")
+            boxes.add(kind)
+            if kind == b"moov":
+                duration = _mvhd_duration(fp, offset, box_size)
+            offset += box_size
+    missing = [name for name in (b"moov", b"mdat") if name not in boxes]
+    if missing:
+        return _result(path, False, "header", duration, "missing " + ", ".join(name.decode() for name in missing))
+    return _result(path, True, "header", duration)
+
+
+def _mvhd_duration(fp, moov_offset, moov_size):
+    fp.seek(moov_offset + 8)
+    data = fp.read(min(moov_size - 8, 4096))
+    index = data.find(b"mvhd")
+    if index < 0:
+        return None
+    body = data[index + 4:]
+    if body[:1] == b"\x01" and len(body) >= 32:
+        timescale, duration = struct.unpack(">IQ", body[20:32])
+    elif len(body) >= 20:
+        timescale, duration = struct.unpack(">II", body[12:20])
+    else:
+        return None
+    return duration / timescale if timescale else None
+
+
+def _read_vint(fp):
+    """Read an EBML variable-length integer; returns (value, length, all ones)"""
+    first = fp.read(1)
+    if not first:
+        raise EOFError()
+    byte = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("invalid EBML length")
+    rest = fp.read(length - 1)
+    if len(rest) < length - 1:
+        raise EOFError()
+    value = byte & (mask - 1)
+    for extra in rest:
+        value = (value << 8) | extra
+    return value, length, value == (1 << (7 * length)) - 1
+
+
+def _mkv_header(path, size):
+    """Check the EBML header and that the Segment is not cut short"""
+    with open(path, "rb") as fp:
+        if fp.read(4) != EBML_MAGIC:
+            return _result(path, False, "header", error="not a Matroska file")
+        try:
+            header_size, _, _ = _read_vint(fp)
+            fp.seek(header_size, os.SEEK_CUR)
+            if fp.read(4) != MKV_SEGMENT:
+                return _result(path, False, "header", error="missing Segment")
+            segment_size, _, unknown = _read_vint(fp)
+        except (EOFError, ValueError) as e:
+            return _result(path, False, "header", error=f"damaged header: {e or 'end of file'}")
+        if not unknown and fp.tell() + segment_size > size:
+            return _result(path, False, "header", error=f"Segment is {fp.tell() + segment_size - size} bytes short")
+    return _result(path, True, "header")
+
+
+def _ts_header(path, size):
+    """Check MPEG-TS packet alignment at the start and the end of the file"""
+    if size % TS_PACKET:
+        return _result(path, False, "header", error="file ends in the middle of a TS packet")
+    with open(path, "rb") as fp:
+        head = fp.read(TS_PACKET * 64)
+        fp.seek(max(0, size - TS_PACKET * 64))
+        tail = fp.read()
+    if any(chunk[i] != 0x47 for chunk in (head, tail) for i in range(0, len(chunk), TS_PACKET)):
+        return _result(path, False, "header", error="lost TS packet sync")
+    return _result(path, True, "header")
+
+
+HEADER_CHECKS = {".mp4": _mp4_header, ".m4v": _mp4_header, ".mkv": _mkv_header, ".webm": _mkv_header, ".ts": _ts_header}
+
+
+def probe(path):
+    """Verify a media file; returns a dict with ok, method, duration and error"""
+    path = Path(path)
+    try:
+        size = path.stat().st_size
+    except OSError as e:
+        return _result(path, False, "stat", error=str(e))
+    if size < MIN_SIZE:
+        return _result(path, False, "stat", error=f"only {size} bytes")
+    try:
+        ffprobe = shutil.which("ffprobe")
+        if ffprobe:
+            return _ffprobe(path, ffprobe, shutil.which("ffmpeg"))
+        check = HEADER_CHECKS.get(path.suffix.lower())
+        return check(path, size) if check else _result(path, True, "size")
+    except Exception as e:
+        return _result(path, False, "probe", error=f"{type(e).__name__}: {e}")
+
+
+def convert(source, target, transcode=None):
+    """Remux source into target's container, or transcode it with ffmpeg arguments"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise VerificationError("ffmpeg is required to remux or transcode")
+    source, target = Path(source), Path(target)
+    part = target.with_name(f"{target.stem}.part{target.suffix}")
+    codecs = list(transcode) if transcode else ["-c", "copy"]
+    try:
+        res = subprocess.run(
+            [ffmpeg, "-nostdin", "-y", "-v", "error", "-i", str(source), "-map", "0", *codecs, str(part)],
+            capture_output=True, text=True, timeout=CONVERT_TIMEOUT
+        )
+    except BaseException:
+        # Timed out; subprocess.run() has already killed ffmpeg
+        part.unlink(missing_ok=True)
+        raise
+    if res.returncode != 0:
+        part.unlink(missing_ok=True)
+        raise VerificationError(res.stderr.strip() or f"ffmpeg exited with {res.returncode}")
+    os.replace(part, target)
+    return target
+
+
+def process(path, container=None, transcode=None):
+    """Verify a download, then remux/transcode it and verify the result
+
+    Runs in a worker process. "retry" in the result tells whether
+    downloading the file again may help.
+    """
+    started = time.perf_counter()
+    path = Path(path)
+    result = probe(path)
+    if not result["ok"]:
+        # Only evidence of damage justifies deleting the file and downloading it
+        # again; when the checker itself failed ("probe") the file is kept
+        return dict(result, retry=result["method"] != "probe", seconds=time.perf_counter() - started)
+    target = path.with_suffix(container) if container else path
+    if target != path or transcode:
+        try:
+            convert(path, target, transcode)
+        except Exception as e:
+            result = dict(result, ok=False, error=f"{'Transcoding' if transcode else 'Remuxing'} failed: {e}")
+        else:
+            if target != path:
+                path.unlink(missing_ok=True)
+            result = probe(target)
+    return dict(result, retry=False, seconds=time.perf_counter() - started)
+
+
+def _init_worker():
+    # A process group of its own lets shutdown() stop the worker together with
+    # the ffprobe/ffmpeg it is running
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+
+class PostProcessor:
+    """Process pool for verification and remux/transcode jobs"""
+
+    def __init__(self, max_workers=DEFAULT_POST_WORKERS, transcode=None):
+        self.max_workers = max(1, int(max_workers))
+        self.transcode = TRANSCODE_PRESETS.get(transcode, transcode)
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn keeps the workers independent of the GUI's and the engine's threads
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+        return self._pool
+
+    def submit(self, path, container=None):
+        """Verify a downloaded file and convert it into container; returns a future of process()'s result"""
+        future = self._executor().submit(process, str(path), container, self.transcode)
+
+        def record(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            result = {"ok": False, "error": str(error)} if error else future.result()
+            telemetry.metrics.inc("verified_total", result="ok" if result["ok"] else "failed")
+            telemetry.event("verified", path=str(path), **{key: value for key, value in result.items() if key != "path"})
+        future.add_done_callback(record)
+        return future
+
+    def run(self, path, container=None):
+        """Process a file and wait for it; raises VerificationError when it fails"""
+        result = self.submit(path, container).result()
+        if not result["ok"]:
+            raise VerificationError(result["error"])
+        return Path(result["path"])
+
+    def shutdown(self, wait=True):
+        """Stop the pool; without wait, running jobs are stopped too instead of finishing"""
+        if self._pool is None:
+            return
+        # Running jobs ignore cancel_futures, so stop their workers as well
+        processes = [] if wait else list((self._pool._processes or {}).values())
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        for process in processes:
+            if not process.is_alive():
+                continue
+            try:
+                os.killpg(process.pid, signal.SIGTERM)
+            except (AttributeError, OSError):
+                process.terminate()
+        self._pool = None
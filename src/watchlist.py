@@ -0,0 +1,204 @@
+"""
+Watchlist sync
+Keeps a list of followed anime and periodically downloads episodes that
+are listed by the provider but missing on disk
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: only threads of one process are serialized
+    fcntl = None
+
+import core
+from paths import user_data_dir
+from scheduler import DownloadScheduler, DEFAULT_WORKERS
+from streams import StreamCache
+
+
+DEFAULT_INTERVAL = 60 * 60
+DEFAULT_JITTER = 0.1
+MAX_BACKOFF = 24 * 60 * 60
+
+
+def entry_key(entry):
+    """Identity of a watchlist entry: one show in one language"""
+    return entry["provider"], entry["identifier"], entry["lang"]
+
+
+class Watchlist:
+    """Followed anime with their language, quality and download directory
+
+    The file is shared by the sync daemon, the command line and the GUI, so
+    every change re-reads it and writes it back under a file lock.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else user_data_dir() / "watchlist.json"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.entries = self._load()
+
+    def _load(self):
+        if not self.path.exists():
+            return []
+        with self.path.open("r", encoding="utf-8") as fp:
+            return json.load(fp)
+
+    def _write(self, entries):
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as fp:
+            json.dump(entries, fp, indent=2)
+        os.replace(tmp, self.path)
+
+    @contextmanager
+    def _locked(self):
+        """Hold the watchlist against other threads and processes"""
+        with self._lock, self.path.with_suffix(".lock").open("a") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def reload(self):
+        """Pick up changes other processes made to the file"""
+        with self._locked():
+            self.entries = self._load()
+        return self.entries
+
+    def save(self):
+        with self._locked():
+            self._write(self.entries)
+
+    def update(self, entry, **fields):
+        """Change fields of an entry in the file, keeping whatever else changed there
+
+        Does nothing if the entry was removed meanwhile.
+        """
+        with self._locked():
+            entries = self._load()
+            for current in entries:
+                if entry_key(current) == entry_key(entry):
+                    current.update(fields)
+                    self._write(entries)
+                    break
+            self.entries = entries
+        entry.update(fields)
+
+    def add(self, anime, lang, quality, download_dir):
+        """Follow an anime, replacing an existing entry for the same show and language"""
+        entry = dict(
+            core.describe_anime(anime),
+            lang=lang.value,
+            quality=int(quality),
+            download_dir=str(download_dir),
+            next_check=0,
+            failures=0,
+        )
+        with self._locked():
+            entries = [e for e in self._load() if entry_key(e) != entry_key(entry)]
+            entries.append(entry)
+            self._write(entries)
+            self.entries = entries
+        return entry
+
+    def remove(self, index):
+        """Stop following the entry at index of entries"""
+        removed = self.entries[index]
+        with self._locked():
+            entries = [e for e in self._load() if entry_key(e) != entry_key(removed)]
+            self._write(entries)
+            self.entries = entries
+        return removed
+
+
+def missing_episodes(entry, episodes):
+    """Episodes of a watchlist entry that are not downloaded yet"""
+    download_dir = Path(entry["download_dir"])
+    return [episode for episode in episodes
+            if not core.completed_download(download_dir / core.episode_filename(entry["name"], episode))]
+
+
+class WatchlistSync:
+    """Poll watchlist entries on a schedule and download what is missing"""
+
+    def __init__(self, watchlist, cache=None, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER,
+                 max_workers=DEFAULT_WORKERS, on_event=None, post_processor=None):
+        self.watchlist = watchlist
+        self.cache = cache
+        self.interval = interval
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.streams = StreamCache(store=cache)
+        self.post_processor = post_processor
+        self.on_event = on_event or (lambda message: None)
+        self._providers = {}
+        self._stop = threading.Event()
+
+    def _provider(self, name):
+        if name not in self._providers:
+            self._providers[name] = core.init_provider(name)
+        return self._providers[name]
+
+    def _delay(self, failures):
+        """Seconds until the next check, backing off exponentially after failures"""
+        delay = min(self.interval * 2 ** failures, MAX_BACKOFF)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def sync_entry(self, entry):
+        """Check one entry and download its missing episodes"""
+        anime = core.anime_from_record(entry, self._provider(entry["provider"]), init=self._provider)
+        lang = core.parse_language(entry["lang"])
+        # One episode-list request per show; it also refreshes the shared cache
+        episodes = core.get_episodes(anime, lang, self.cache, refresh=True)
+        missing = missing_episodes(entry, episodes)
+        if not missing:
+            self.on_event(f"{entry['name']}: up to date ({len(episodes)} episodes)")
+            return [], []
+        self.on_event(f"{entry['name']}: downloading {len(missing)} new episodes")
+        scheduler = DownloadScheduler(
+            anime, lang, entry["quality"], Path(entry["download_dir"]),
+            anime_name=entry["name"],
+            max_workers=self.max_workers,
+            on_episode_done=lambda episode, path: self.on_event(f"{entry['name']}: Episode {episode} done"),
+            on_episode_failed=lambda episode, error: self.on_event(f"{entry['name']}: Episode {episode} failed: {error}"),
+            stream_cache=self.streams,
+            post_processor=self.post_processor
+        )
+        return scheduler.run(missing)
+
+    def sync_due(self, force=False):
+        """Sync every entry whose next check is due; returns seconds until the next one"""
+        # Entries may have been added or removed by `watch add` or the GUI since the last pass
+        for entry in list(self.watchlist.reload()):
+            if self._stop.is_set():
+                break
+            if not force and entry.get("next_check", 0) > time.time():
+                continue
+            try:
+                _, failed = self.sync_entry(entry)
+                failures = entry.get("failures", 0) + 1 if failed else 0
+            except Exception as e:
+                failures = entry.get("failures", 0) + 1
+                self.on_event(f"{entry['name']}: sync failed: {e}")
+            self.watchlist.update(entry, failures=failures, next_check=time.time() + self._delay(failures))
+        upcoming = [entry.get("next_check", 0) for entry in self.watchlist.entries]
+        return max(0.0, min(upcoming) - time.time()) if upcoming else self.interval
+
+    def run(self, once=False):
+        """Sync until stop() is called, or a single forced pass with once=True"""
+        if once:
+            self.sync_due(force=True)
+            return
+        while not self._stop.is_set():
+            self._stop.wait(self.sync_due())
+
+    def stop(self):
+        self._stop.set()